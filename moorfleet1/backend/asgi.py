@@ -0,0 +1,60 @@
+"""ASGI entry point: uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Units and alarms are served by async handlers on an aiomysql pool. Every
+other path (KPIs, metrics) goes to the Flask app, which runs on its own
+thread pool so heavy analytics never block the event loop. Both report
+Server-Timing headers and feed the /api/metrics histograms.
+
+Optional dependencies for this mode: starlette, aiomysql, a2wsgi, uvicorn.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.routing import Mount, Route
+
+from server import app as flask_app
+from routes.alarms import alarm_sources
+from routes.units import state_feed, state_store
+from routes.units_async import routes as unit_routes
+from routes.alarms_async import routes as alarm_routes
+from utils import async_db
+from utils.http_cache import COMPRESS_MIN_BYTES, GZIP_LEVEL
+from utils.metrics import TimingMiddleware
+
+# Threads running Flask (KPI) requests
+KPI_WORKERS = int(os.environ.get("MOORFLEET_ASGI_KPI_WORKERS", "8"))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await async_db.open_pool()
+    # Seed the latest-state index, then keep it tailing for the async handlers
+    await asyncio.get_running_loop().run_in_executor(None, state_feed.refresh, 0)
+    state_feed.start()
+    state_store.start()
+    alarm_sources.warm()
+    try:
+        yield
+    finally:
+        await async_db.close_pool()
+
+
+# Timing and gzip for the async handlers only; the Flask app times and compresses its own
+# responses (gzip or brotli)
+_compressed = Middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES, compresslevel=GZIP_LEVEL)
+async_routes = [Route(route.path, route.endpoint, methods=route.methods,
+                      middleware=[Middleware(TimingMiddleware, endpoint=route.path), _compressed])
+                for route in (*unit_routes, *alarm_routes)]
+
+app = Starlette(
+    routes=[*async_routes, Mount("/", app=WSGIMiddleware(flask_app, workers=KPI_WORKERS))],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                           expose_headers=["X-Next-Before", "Server-Timing", "ETag"])],
+    lifespan=lifespan
+)
@@ -0,0 +1,9 @@
+"""Synthetic data generator and benchmark runner for the backend.
+
+Run from the backend directory against a scratch MySQL (configured through
+the usual MOORFLEET_DB_* variables), never against a live historian:
+
+    python -m bench.generate --units 100 --days 365 --period 1 --reset
+    python -m bench.run --out bench/results/before.json
+    python -m bench.run --compare bench/results/before.json bench/results/after.json
+"""
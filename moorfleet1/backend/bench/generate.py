@@ -0,0 +1,236 @@
+# bench/generate.py
+"""Fill a stand-in database with realistic landing, historian and alarm rows."""
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+
+import mysql.connector
+import numpy as np
+
+from db import DB_CONFIG
+from kpi_calculations.kpi_alarm_dict import FAILURE_ALARMS
+from kpi_calculations.kpi_availability import UNITS
+from routes.units import UNIT_ID_MAPPING
+from utils.historian import HISTORIAN_DRIVER
+
+DAY = 86400
+INSERT_ROWS = 20000
+
+# Operating cycle: (state, mean dwell in seconds)
+STATE_CYCLE = [
+    (2, 1800),    # Idle
+    (3, 300),     # Arming
+    (4, 900),     # Ready to Moor
+    (5, 120),     # Mooring
+    (6, 14400),   # Moored
+    (7, 120),     # Detaching
+    (8, 60),      # Stepping
+    (9, 60),      # Warping
+    (10, 300),    # Parking
+    (11, 7200),   # Parked
+]
+
+# Mean seconds between alarm episodes and mean seconds until they clear
+REMOTE_ON, REMOTE_OFF = 8 * 3600, 2 * 3600
+MAINT_EVERY, MAINT_LENGTH = 7 * DAY, 3600
+FAILURE_EVERY, FAILURE_LENGTH = DAY, 900
+ACK_DELAY = 300
+
+SCHEMA = [
+    "CREATE DATABASE IF NOT EXISTS cc_landing",
+    "CREATE DATABASE IF NOT EXISTS ignitiondb",
+    """CREATE TABLE IF NOT EXISTS cc_landing.data_historical (
+        tagpath_id INT NOT NULL, intvalue INT, t_stamp BIGINT NOT NULL,
+        KEY idx_t_stamp (t_stamp), KEY idx_tag_t_stamp (tagpath_id, t_stamp))""",
+    """CREATE TABLE IF NOT EXISTS cc_landing.data_alarms (
+        alarm_id INT NOT NULL, eventtype TINYINT NOT NULL, eventtime BIGINT NOT NULL,
+        KEY idx_eventtime (eventtime), KEY idx_alarm_eventtime (alarm_id, eventtime))""",
+    """CREATE TABLE IF NOT EXISTS cc_landing.data_alarms_dict (
+        id INT PRIMARY KEY, source VARCHAR(255))""",
+    """CREATE TABLE IF NOT EXISTS ignitiondb.sqlth_partitions (
+        pname VARCHAR(255) PRIMARY KEY, drvid INT, start_time BIGINT, end_time BIGINT)""",
+    """CREATE TABLE IF NOT EXISTS ignitiondb.alarm_events (
+        id INT AUTO_INCREMENT PRIMARY KEY, source VARCHAR(255), priority INT,
+        eventtime DATETIME(3), eventtype INT,
+        KEY idx_eventtime (eventtime), KEY idx_source (source))""",
+]
+
+PARTITION_SCHEMA = """CREATE TABLE IF NOT EXISTS ignitiondb.{table} (
+    tagid INT NOT NULL, intvalue BIGINT, floatvalue DOUBLE, stringvalue VARCHAR(255),
+    datevalue DATETIME, dataintegrity INT, t_stamp BIGINT NOT NULL,
+    PRIMARY KEY (tagid, t_stamp), KEY idx_t_stamp (t_stamp))"""
+
+
+def historian_tagid(unit_no):
+    """Historian tag of a unit: the routes' mapping where defined, else 100 + n."""
+    return UNIT_ID_MAPPING.get(unit_no, 100 + unit_no)
+
+
+def alarm_source(unit_no, name):
+    return f"prov:default:/tag:MoorUnit{historian_tagid(unit_no)}/Alarms:/alm:{name}"
+
+
+def build_dictionary(n_units):
+    """{(unit_no, alarm name): alarm id}; maintenance alarms keep the ids the KPIs expect."""
+    reserved = {cfg["maint_alarm_id"]: unit for unit, cfg in UNITS.items()}
+    names = sorted({a for alarms in FAILURE_ALARMS.values() for a in alarms})
+    ids, next_id = {}, 1
+    for unit_no in range(1, n_units + 1):
+        unit = f"U{unit_no}"
+        for name in [f"{unit} in Remote", f"{unit} Maintenance"] + [a.replace("Ux", unit) for a in names]:
+            if name == f"{unit} Maintenance" and unit in UNITS:
+                ids[(unit_no, name)] = UNITS[unit]["maint_alarm_id"]
+                continue
+            while next_id in reserved:
+                next_id += 1
+            ids[(unit_no, name)] = next_id
+            next_id += 1
+    return ids
+
+
+def state_transitions(rng, start, end):
+    """(times, states) of one unit's operating cycle over [start, end)."""
+    times, states = [], []
+    t, i = start - int(rng.integers(0, DAY)), int(rng.integers(0, len(STATE_CYCLE)))
+    while t < end:
+        state, mean = STATE_CYCLE[i % len(STATE_CYCLE)]
+        times.append(t)
+        states.append(state)
+        t += max(int(rng.exponential(mean)), 1)
+        i += 1
+    return np.array(times, dtype=np.int64), np.array(states, dtype=np.int16)
+
+
+def episodes(rng, start, end, every, length):
+    """Non-overlapping (created, cleared) pairs; the last may stay open."""
+    out, t = [], start + int(rng.exponential(every))
+    while t < end:
+        cleared = t + max(int(rng.exponential(length)), 1)
+        out.append((t, cleared if cleared < end else None))
+        t = cleared + int(rng.exponential(every))
+    return out
+
+
+def alarm_events(rng, unit_no, ids, start, end):
+    """[(eventtime, alarm_id, eventtype, name)] for one unit."""
+    unit = f"U{unit_no}"
+    events = []
+
+    def add(name, created, cleared, ack=False):
+        events.append((created, ids[(unit_no, name)], 0, name))
+        if ack and (cleared is None or created + ACK_DELAY < cleared):
+            events.append((created + ACK_DELAY, ids[(unit_no, name)], 2, name))
+        if cleared is not None:
+            events.append((cleared, ids[(unit_no, name)], 1, name))
+
+    for created, cleared in episodes(rng, start, end, REMOTE_OFF, REMOTE_ON):
+        add(f"{unit} in Remote", created, cleared)
+    for created, cleared in episodes(rng, start, end, MAINT_EVERY, MAINT_LENGTH):
+        add(f"{unit} Maintenance", created, cleared, ack=True)
+    failures = [name for (u, name) in ids if u == unit_no and "Failed" in name]
+    for created, cleared in episodes(rng, start, end, FAILURE_EVERY, FAILURE_LENGTH):
+        add(failures[int(rng.integers(0, len(failures)))], created, cleared, ack=True)
+    return events
+
+
+def month_partitions(start, end):
+    """[(table, start_ms, end_ms)] for every month touching [start, end)."""
+    first = datetime.fromtimestamp(start, tz=timezone.utc).replace(day=1, hour=0, minute=0, second=0)
+    parts = []
+    while int(first.timestamp()) < end:
+        nxt = first.replace(year=first.year + first.month // 12, month=first.month % 12 + 1)
+        parts.append((f"sqlt_data_{HISTORIAN_DRIVER}_{first.year}_{first.month:02d}",
+                      int(first.timestamp()) * 1000, int(nxt.timestamp()) * 1000))
+        first = nxt
+    return parts
+
+
+def insert(cursor, query, rows):
+    for i in range(0, len(rows), INSERT_ROWS):
+        cursor.executemany(query, rows[i:i + INSERT_ROWS])
+
+
+def generate(n_units, days, period, end=None, seed=0, reset=False):
+    end = int(end if end is not None else time.time())
+    start = end - days * DAY
+    rng = np.random.default_rng(seed)
+    conn = mysql.connector.connect(**{**DB_CONFIG, "autocommit": False})
+    cursor = conn.cursor()
+    partitions = month_partitions(start, end)
+
+    if reset:
+        for table in ("cc_landing.data_historical", "cc_landing.data_alarms", "cc_landing.data_alarms_dict",
+                      "ignitiondb.sqlth_partitions", "ignitiondb.alarm_events"):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        for table, _, _ in partitions:
+            cursor.execute(f"DROP TABLE IF EXISTS ignitiondb.{table}")
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    cursor.execute("SELECT COUNT(*) FROM cc_landing.data_historical")
+    if cursor.fetchone()[0] and not reset:
+        sys.exit("cc_landing.data_historical already has rows; pass --reset to replace them")
+
+    for table, start_ms, end_ms in partitions:
+        cursor.execute(PARTITION_SCHEMA.format(table=table))
+        cursor.execute("REPLACE INTO ignitiondb.sqlth_partitions VALUES (%s, %s, %s, %s)",
+                       (table, HISTORIAN_DRIVER, start_ms, end_ms))
+
+    ids = build_dictionary(n_units)
+    insert(cursor, "INSERT INTO cc_landing.data_alarms_dict (id, source) VALUES (%s, %s)",
+           [(alarm_id, alarm_source(unit_no, name)) for (unit_no, name), alarm_id in ids.items()])
+    conn.commit()
+
+    counts = {"data_historical": 0, "sqlt_data": 0, "data_alarms": 0, "alarm_events": 0}
+    for unit_no in range(1, n_units + 1):
+        trans_t, trans_s = state_transitions(rng, start, end)
+        tagid = historian_tagid(unit_no)
+        for day_start in range(start, end, DAY):
+            samples = np.arange(day_start, min(day_start + DAY, end), period, dtype=np.int64)
+            states = trans_s[np.searchsorted(trans_t, samples, side="right") - 1]
+            insert(cursor, "INSERT INTO cc_landing.data_historical (tagpath_id, intvalue, t_stamp) "
+                           "VALUES (%s, %s, %s)",
+                   list(zip([unit_no] * len(samples), states.tolist(), samples.tolist())))
+            counts["data_historical"] += len(samples)
+            for table, start_ms, end_ms in partitions:
+                in_part = (samples * 1000 >= start_ms) & (samples * 1000 < end_ms)
+                if in_part.any():
+                    insert(cursor, f"INSERT INTO ignitiondb.{table} (tagid, intvalue, dataintegrity, t_stamp) "
+                                   "VALUES (%s, %s, 192, %s)",
+                           list(zip([tagid] * int(in_part.sum()), states[in_part].tolist(),
+                                    (samples[in_part] * 1000).tolist())))
+                    counts["sqlt_data"] += int(in_part.sum())
+            conn.commit()
+
+        events = sorted(alarm_events(rng, unit_no, ids, start, end))
+        insert(cursor, "INSERT INTO cc_landing.data_alarms (alarm_id, eventtype, eventtime) VALUES (%s, %s, %s)",
+               [(alarm_id, eventtype, t) for t, alarm_id, eventtype, _ in events])
+        insert(cursor, "INSERT INTO ignitiondb.alarm_events (source, priority, eventtime, eventtype) "
+                       "VALUES (%s, %s, %s, %s)",
+               [(alarm_source(unit_no, name), 4 if "Failed" in name else 2,
+                 datetime.fromtimestamp(t, tz=timezone.utc).replace(tzinfo=None), eventtype)
+                for t, _, eventtype, name in events])
+        conn.commit()
+        counts["data_alarms"] += len(events)
+        counts["alarm_events"] += len(events)
+        print(f"U{unit_no}: {counts}", flush=True)
+
+    cursor.close()
+    conn.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--units", type=int, default=2)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--period", type=int, default=1, help="seconds between state samples")
+    parser.add_argument("--end", type=int, help="epoch seconds of the newest sample (default now)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate the generated tables")
+    args = parser.parse_args(argv)
+    generate(args.units, args.days, args.period, args.end, args.seed, args.reset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# bench/run.py
+"""Time every KPI function and API endpoint per duration and record the results as JSON."""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import db
+from kpi_calculations.kpi_availability import calculate_AVAILABILITY_KPI
+from kpi_calculations.kpi_cache import kpi_cache
+from kpi_calculations.kpi_common import DUR_TO_DELTA
+from kpi_calculations.kpi_history import calculate_KPI_HISTORY
+from kpi_calculations.kpi_mtbf import calculate_MTBF_KPI
+from kpi_calculations.kpi_utilization import calculate_UTIL_KPI
+from utils import timing
+
+DURATIONS = ["1D", "7D", "30D", "1Y"]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def function_cases(units):
+    for dur in DURATIONS:
+        for unit in units:
+            yield f"availability/{unit}/{dur}", lambda d=dur, u=unit: calculate_AVAILABILITY_KPI(d, u)
+            yield f"mtbf/{unit}/{dur}", lambda d=dur, u=unit: calculate_MTBF_KPI(d, u)
+            yield f"utilization/{unit}/{dur}", lambda d=dur, u=unit: calculate_UTIL_KPI(d, u)
+            yield f"kpi_history/{unit}/{dur}", lambda d=dur, u=unit: calculate_KPI_HISTORY(d, u)
+
+
+def endpoint_cases(client, units):
+    """Read-only endpoints. Alarm acknowledge / clear / batch are left out: they rewrite
+    data_alarms rows, so every later case and run would read different data."""
+    def get(url):
+        def call():
+            response = client.get(url)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            return response.get_data()
+        return call
+
+    def first_message(url):
+        # The stream never ends: time up to its first message (the current states, or a keep-alive)
+        def call():
+            response = client.get(url, buffered=False)
+            try:
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{url} -> {response.status_code}")
+                return next(iter(response.response))
+            finally:
+                response.close()
+        return call
+
+    display_ids = [unit.lstrip("U") for unit in units]
+    now = int(time.time())
+    yield "GET /api/units/", get("/api/units/")
+    yield "GET /api/units/stream", first_message("/api/units/stream")
+    yield "GET /api/alarms/recent", get("/api/alarms/recent")
+    for display_id in display_ids:
+        yield f"GET /api/units/{display_id}", get(f"/api/units/{display_id}")
+        yield f"GET /api/units/{display_id}/history", get(f"/api/units/{display_id}/history")
+        yield f"GET /api/units/{display_id}/dwell", get(f"/api/units/{display_id}/dwell")
+        yield f"GET /api/alarms/recent/{display_id}", get(f"/api/alarms/recent/{display_id}")
+    for dur in DURATIONS:
+        yield f"GET /api/kpis/?range={dur}", get(f"/api/kpis/?range={dur}")
+        start = now - int(DUR_TO_DELTA[dur].total_seconds())
+        bucket = "1h" if dur in ("1D", "7D") else "1d"
+        for unit in units:
+            yield (f"GET /api/kpis/{unit}/window?range={dur}&bucket={bucket}",
+                   get(f"/api/kpis/{unit}/window?start={start}&end={now}&bucket={bucket}"))
+            yield f"GET /api/kpis/{unit}/{dur}", get(f"/api/kpis/{unit}/{dur}")
+            yield f"GET /api/kpis/{unit}/history?range={dur}", get(f"/api/kpis/{unit}/history?range={dur}")
+            yield (f"GET /api/kpis/{unit}/history?range={dur}&format=columns",
+                   get(f"/api/kpis/{unit}/history?range={dur}&format=columns"))
+
+
+def measure(name, kind, fn, repeat):
+    """Wall times over ``repeat`` plain runs, then one traced run for phases, rows and peak memory."""
+    result = {"name": name, "kind": kind}
+    try:
+        fn()  # warm-up: imports, alarm dictionary, partition list
+        walls = []
+        for _ in range(repeat):
+            kpi_cache.clear()
+            started = time.perf_counter()
+            fn()
+            walls.append(time.perf_counter() - started)
+        kpi_cache.clear()
+        token = timing.begin()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            timings = timing.end(token)
+        result.update({
+            "wall_s": walls,
+            "wall_min_s": min(walls),
+            "wall_median_s": statistics.median(walls),
+            "phases_s": timings.phases,
+            "rows_fetched": timings.rows,
+            "peak_mem_bytes": peak
+        })
+    except Exception as e:
+        result["error"] = str(e)
+    print(f"{name}: " + (f"{result['wall_median_s'] * 1000:.1f} ms, {result['rows_fetched']} rows, "
+                         f"{result['peak_mem_bytes'] / 2**20:.1f} MiB" if "error" not in result
+                         else f"error: {result['error']}"), flush=True)
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(units, repeat, only=None):
+    # Private state store, filled once before timing so the history endpoint runs in steady state;
+    # no updater thread polls MySQL while endpoints are timed, so the fill counts as current throughout
+    os.environ.setdefault("MOORFLEET_STATE_STORE_DIR", tempfile.mkdtemp(prefix="moorfleet-bench-"))
+    os.environ.setdefault("MOORFLEET_STATE_STORE", "0")
+    os.environ.setdefault("MOORFLEET_STATE_STORE_READY_LAG", str(24 * 3600))
+    # Time the on-demand KPI path, not rows written by the precompute scheduler
+    os.environ.setdefault("MOORFLEET_KPI_PRECOMPUTE", "0")
+    # Rollups are written once, in full, before timing; no maintainer thread runs meanwhile
+    os.environ.setdefault("MOORFLEET_KPI_ROLLUP", "0")
+    os.environ.setdefault("MOORFLEET_KPI_ROLLUP_DAYS_PER_RUN", "400")
+    from server import app
+    from routes.alarms import alarm_sources
+    from routes.kpi import kpi_rollup
+    from routes.units import state_store
+
+    state_store.update_once()
+    alarm_sources.refresh(0)
+    kpi_rollup.run_once()
+    cases = [(name, "function", fn) for name, fn in function_cases(units)]
+    cases += [(name, "endpoint", fn) for name, fn in endpoint_cases(app.test_client(), units)]
+    results = [measure(name, kind, fn, repeat) for name, kind, fn in cases
+               if only is None or only in name]
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "database": {key: db.DB_CONFIG[key] for key in ("host", "port", "database")},
+            "units": units,
+            "repeat": repeat
+        },
+        "results": results
+    }
+
+
+def compare(before_path, after_path):
+    """Print median wall time, rows and peak memory side by side for two result files."""
+    with open(before_path) as f:
+        before = {r["name"]: r for r in json.load(f)["results"]}
+    with open(after_path) as f:
+        after = {r["name"]: r for r in json.load(f)["results"]}
+    print(f"{'case':48} {'before ms':>10} {'after ms':>10} {'x':>6} {'rows':>18} {'peak MiB':>16}")
+    for name in [n for n in before if n in after]:
+        b, a = before[name], after[name]
+        if "error" in b or "error" in a:
+            print(f"{name:48} {'error':>10}")
+            continue
+        speedup = b["wall_median_s"] / a["wall_median_s"] if a["wall_median_s"] else float("inf")
+        print(f"{name:48} {b['wall_median_s'] * 1000:10.1f} {a['wall_median_s'] * 1000:10.1f} {speedup:6.2f} "
+              f"{b['rows_fetched']:>8}->{a['rows_fetched']:<9} "
+              f"{b['peak_mem_bytes'] / 2**20:7.1f}->{a['peak_mem_bytes'] / 2**20:<7.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--units", default="U1,U2", help="comma-separated KPI units")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    parser.add_argument("--out", help="result file (default bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.units.split(","), args.repeat, args.only)
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,256 @@
+import os
+import threading
+import time
+from collections import deque
+
 import mysql.connector
+import numpy as np
+
+from utils import timing
+
+# Connection settings (override through the environment)
+DB_CONFIG = {
+    "host": os.environ.get("MOORFLEET_DB_HOST", "127.0.0.1"),
+    "port": int(os.environ.get("MOORFLEET_DB_PORT", "3306")),
+    "user": os.environ.get("MOORFLEET_DB_USER", "root"),
+    "password": os.environ.get("MOORFLEET_DB_PASSWORD", "U8NbpiQxGyemHJrB"),
+    "database": os.environ.get("MOORFLEET_DB_NAME", "ignitiondb"),
+    "connection_timeout": int(os.environ.get("MOORFLEET_DB_CONNECT_TIMEOUT", "5")),
+    "autocommit": True
+}
+
+# Pool settings
+POOL_SIZE = int(os.environ.get("MOORFLEET_DB_POOL_SIZE", "10"))              # max open connections
+POOL_TIMEOUT = float(os.environ.get("MOORFLEET_DB_POOL_TIMEOUT", "10"))      # seconds to wait for a free one
+POOL_RECYCLE = float(os.environ.get("MOORFLEET_DB_POOL_RECYCLE", "1800"))    # seconds before a connection is replaced
+POOL_PING_IDLE = float(os.environ.get("MOORFLEET_DB_POOL_PING_IDLE", "30"))  # idle seconds before a health check
+
+# Rows per fetchmany() when streaming large result sets
+FETCH_CHUNK_ROWS = int(os.environ.get("MOORFLEET_DB_FETCH_CHUNK_ROWS", "50000"))
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within the pool timeout."""
+
+
+class TimedCursor:
+    """Cursor proxy charging execute to the "query" phase and fetches to "fetch"."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        with timing.phase("query"):
+            return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with timing.phase("query"):
+            return self._cursor.executemany(*args, **kwargs)
+
+    def fetchall(self):
+        with timing.phase("fetch"):
+            rows = self._cursor.fetchall()
+        timing.count_rows(len(rows))
+        return rows
+
+    def fetchmany(self, *args, **kwargs):
+        with timing.phase("fetch"):
+            rows = self._cursor.fetchmany(*args, **kwargs)
+        timing.count_rows(len(rows))
+        return rows
+
+    def fetchone(self):
+        with timing.phase("fetch"):
+            row = self._cursor.fetchone()
+        timing.count_rows(row is not None)
+        return row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """A checked-out connection; ``close()`` hands it back to the pool."""
+
+    def __init__(self, pool, raw, created):
+        self._pool = pool
+        self._raw = raw
+        self._created = created
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to the pool")
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self.__getattr__("cursor")(*args, **kwargs)
+        # Only requests being timed pay for the proxy
+        return TimedCursor(cursor) if timing.current() is not None else cursor
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw, self._created)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of MySQL connections.
+
+    Idle connections are pinged before reuse once they have been idle for
+    ``ping_idle`` seconds and replaced after ``recycle`` seconds of age.
+    """
+
+    def __init__(self, config, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 recycle=POOL_RECYCLE, ping_idle=POOL_PING_IDLE):
+        self.config = dict(config)
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_idle = ping_idle
+        self._idle = deque()  # (raw, created, returned_at)
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        return mysql.connector.connect(**self.config)
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def _healthy(self, raw, created, returned_at):
+        now = time.monotonic()
+        if now - created > self.recycle:
+            return False
+        if now - returned_at > self.ping_idle:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def acquire(self, timeout=None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            with self._cond:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No free database connection within {self.timeout}s")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    raw, created, returned_at = self._idle.pop()
+                else:
+                    self._open += 1
+                    raw = None
+
+            if raw is None:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                return PooledConnection(self, raw, time.monotonic())
+
+            if self._healthy(raw, created, returned_at):
+                return PooledConnection(self, raw, created)
+            self._discard(raw)
+
+    def _release(self, raw, created):
+        try:
+            # Leave no half-read result or open transaction for the next caller
+            if getattr(raw, "unread_result", False):
+                raw.consume_results()
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+        with self._cond:
+            self._idle.append((raw, created, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for raw, _, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            return {"size": self.size, "open": self._open, "idle": len(self._idle)}
+
+
+pool = ConnectionPool(DB_CONFIG)
+
 
 def get_connection():
-    return mysql.connector.connect(
-        host="127.0.0.1",
-        user="root",
-        password="U8NbpiQxGyemHJrB",
-        database="cc_dw"
-    )
\ No newline at end of file
+    """Check out a pooled connection (use as a context manager or call close())."""
+    with timing.phase("connect"):
+        return pool.acquire()
+
+
+def _decode_chunk(rows, dtype):
+    """Tuples -> structured array in one C-level pass; NULLs become 0."""
+    try:
+        return np.array(rows, dtype=dtype)
+    except TypeError:
+        return np.array([tuple(0 if v is None else v for v in row) for row in rows], dtype=dtype)
+
+
+def iter_chunks(query, params, columns, chunk_rows=FETCH_CHUNK_ROWS):
+    """Stream a query through an unbuffered cursor as dicts of typed NumPy columns.
+
+    ``columns`` is a list of (name, dtype) matching the SELECT list; at most
+    ``chunk_rows`` rows are held as Python objects at any time.
+    """
+    dtype = np.dtype(columns)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            chunk = _decode_chunk(rows, dtype)
+            yield {name: chunk[name] for name, _ in columns}
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def fetch_columns(query, params, columns, chunk_rows=FETCH_CHUNK_ROWS):
+    """Stream a query into compact typed columns ({name: ndarray}).
+
+    Chunks are copied into preallocated arrays that grow geometrically and
+    are trimmed to the final row count.
+    """
+    capacity = chunk_rows
+    out = {name: np.empty(capacity, dtype=dt) for name, dt in columns}
+    size = 0
+    for chunk in iter_chunks(query, params, columns, chunk_rows):
+        n = len(next(iter(chunk.values())))
+        if size + n > capacity:
+            capacity = max(capacity * 2, size + n)
+            for name in out:
+                grown = np.empty(capacity, dtype=out[name].dtype)
+                grown[:size] = out[name][:size]
+                out[name] = grown
+        for name, values in chunk.items():
+            out[name][size:size + n] = values
+        size += n
+    return {name: values[:size].copy() if size < capacity else values for name, values in out.items()}
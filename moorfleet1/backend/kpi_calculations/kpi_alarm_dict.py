@@ -0,0 +1,208 @@
+# kpi_calculations/kpi_alarm_dict.py
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+from db import get_connection
+
+# Failure alarms per category ("Ux" is replaced by the unit name)
+FAILURE_ALARMS = {
+    "arm": [
+        "Ux Check Services Failed", "Ux Check Fluid Mgmt Failed", "Ux Check Vacuum Failed", "Ux Charge Vacuum Failed",
+        "Ux Check Hydraulics Failed", "Ux Check C1 Failed", "Ux Check C2 Failed", "Ux Check C3 Failed", "Ux Check C4 Failed",
+        "Ux Move to RTM Failed"
+    ],
+    "reposition": ["Ux Stepping Failed to Reposition"],
+    "moor": [
+        "Ux Mooring Failed to Reach Vessel", "Ux Mooring Failed to Couple",
+        "Ux Mooring Failed to Retract", "Ux Mooring Failed to Decouple"
+    ],
+    "warp": ["Ux Warping Failed to Move Left", "Ux Warping Failed to Move Right"],
+    "step": [
+        "Ux Stepping Failed to Decouple", "Ux Stepping Failed to Retract",
+        "Ux Stepping Failed to Reposition", "Ux Stepping Failed to Reach Vessel",
+        "Ux Stepping Failed to Couple"
+    ],
+    "detach": ["Ux Detaching Failed to Retract", "Ux Detaching Move to RTM Failed"],
+    "park": [
+        "Ux Parking C1 Failed to Park", "Ux Parking C2 Failed to Park", "Ux Parking C3 Failed to Park",
+        "Ux Parking C4 Failed to Park", "Ux Parking Failed to Discharge", "Ux Parking Failed to Park"
+    ],
+}
+
+# One bit per category; an alarm can belong to several (e.g. stepping reposition)
+CATEGORY_BITS = {key: 1 << i for i, key in enumerate(FAILURE_ALARMS)}
+
+# Minimum seconds between refreshes triggered by unseen ids (newer than the
+# newest loaded id / gaps below it, which are usually orphaned events)
+NEW_ID_REFRESH_INTERVAL = 1
+REFRESH_INTERVAL = 30
+
+_SOURCE_RE = re.compile(r'/tag:(.*?):?/alm:(.*)')
+_UNIT_RE = re.compile(r'\b(U\d+)\b')
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def parse_source(source):
+    """source -> (tag, alarm_name, unit); parts that cannot be parsed are None."""
+    m = _SOURCE_RE.search(source) if isinstance(source, str) else None
+    if not m:
+        return None, None, None
+    tag, name = m.group(1), m.group(2)
+    unit = _UNIT_RE.search(name)
+    return _intern(tag), _intern(name), _intern(unit.group(1)) if unit else None
+
+
+def failure_categories(alarm_name, unit):
+    """Category bitmask of an alarm name for one unit (0 if not a failure alarm)."""
+    if not isinstance(alarm_name, str):
+        return 0
+    name = alarm_name.strip().lower()
+    bits = 0
+    for key, alarms in FAILURE_ALARMS.items():
+        if name in (a.replace("Ux", unit).lower() for a in alarms):
+            bits |= CATEGORY_BITS[key]
+    return bits
+
+
+class AlarmDictState:
+    """One version of the dictionary: id-indexed arrays, never modified once built.
+
+    ``source``, ``tag``, ``alarm_name`` and ``unit`` are object arrays holding
+    interned strings; ``category`` is the failure-category bitmask for the
+    unit named in the alarm. Derived per-id tables (``table``) are cached on
+    the version they were computed from.
+    """
+
+    def __init__(self, version=0, max_id=-1, known=None, source=None, tag=None, alarm_name=None, unit=None,
+                 category=None):
+        self.version = version
+        self.max_id = max_id
+        self.known = np.zeros(0, dtype=bool) if known is None else known
+        self.source = np.empty(0, dtype=object) if source is None else source
+        self.tag = np.empty(0, dtype=object) if tag is None else tag
+        self.alarm_name = np.empty(0, dtype=object) if alarm_name is None else alarm_name
+        self.unit = np.empty(0, dtype=object) if unit is None else unit
+        self.category = np.zeros(0, dtype=np.int16) if category is None else category
+        self._tables = {}
+
+    def extended(self, rows):
+        """A new version with ``rows`` of (id, source) added (ids ascending, above max_id)."""
+        size = max(rows[-1][0] + 1, len(self.known))
+        pad = size - len(self.known)
+        known = np.r_[self.known, np.zeros(pad, dtype=bool)]
+        source = np.r_[self.source, np.empty(pad, dtype=object)]
+        tag = np.r_[self.tag, np.empty(pad, dtype=object)]
+        alarm_name = np.r_[self.alarm_name, np.empty(pad, dtype=object)]
+        unit = np.r_[self.unit, np.empty(pad, dtype=object)]
+        category = np.r_[self.category, np.zeros(pad, dtype=np.int16)]
+        for alarm_id, raw_source in rows:
+            alarm_tag, name, alarm_unit = parse_source(raw_source)
+            known[alarm_id] = True
+            source[alarm_id] = _intern(raw_source)
+            tag[alarm_id] = alarm_tag
+            alarm_name[alarm_id] = name
+            unit[alarm_id] = alarm_unit
+            category[alarm_id] = failure_categories(name, alarm_unit) if alarm_unit else 0
+        return AlarmDictState(self.version + 1, rows[-1][0], known, source, tag, alarm_name, unit, category)
+
+    def contains(self, alarm_ids):
+        """Boolean mask: ids that have a dictionary entry."""
+        alarm_ids = np.asarray(alarm_ids, dtype=np.int64)
+        inside = (alarm_ids >= 0) & (alarm_ids < len(self.known))
+        mask = np.zeros(len(alarm_ids), dtype=bool)
+        mask[inside] = self.known[alarm_ids[inside]]
+        return mask
+
+    def table(self, key, fn):
+        """Per-id array of fn(alarm_name), cached under ``key`` for this version."""
+        table = self._tables.get(key)
+        if table is None:
+            table = np.array([bool(fn(name)) if known else False
+                              for name, known in zip(self.alarm_name, self.known)], dtype=bool)
+            # Concurrent builders compute the same array; the first one stored wins
+            table = self._tables.setdefault(key, table)
+        return table
+
+    def unit_categories(self, unit):
+        """Per-id failure-category bitmask for one unit's alarm lists, cached for this version."""
+        key = ("categories", unit)
+        table = self._tables.get(key)
+        if table is None:
+            table = np.array([failure_categories(name, unit) if known else 0
+                              for name, known in zip(self.alarm_name, self.known)], dtype=np.int16)
+            table = self._tables.setdefault(key, table)
+        return table
+
+
+class AlarmDict:
+    """``data_alarms_dict`` loaded once and pre-parsed into id-indexed arrays.
+
+    Each refresh builds a new AlarmDictState and swaps it in with one
+    assignment, so a reader holding ``state`` always sees arrays of one
+    version. Callers that read several arrays should take ``state`` once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refreshed_at = None
+        self.state = AlarmDictState()
+
+    def refresh(self):
+        """Load dictionary entries newer than the highest id seen so far."""
+        with self._lock:
+            state = self.state
+            conn = get_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT id, source
+                    FROM cc_landing.data_alarms_dict
+                    WHERE id > %s
+                    ORDER BY id
+                """, (state.max_id,))
+                rows = cur.fetchall()
+                cur.close()
+            finally:
+                conn.close()
+            self._refreshed_at = time.monotonic()
+            if rows:
+                self.state = state.extended(rows)
+
+    def ensure(self, alarm_ids):
+        """Refresh if any of the given ids is not in the dictionary yet."""
+        alarm_ids = np.asarray(alarm_ids)
+        refreshed_at = self._refreshed_at
+        if not len(alarm_ids):
+            if refreshed_at is None:
+                self.refresh()
+            return
+        since = None if refreshed_at is None else time.monotonic() - refreshed_at
+        state = self.state
+        if int(alarm_ids.max()) > state.max_id:
+            if since is None or since > NEW_ID_REFRESH_INTERVAL:
+                self.refresh()
+        elif not state.contains(alarm_ids).all():
+            if since is None or since > REFRESH_INTERVAL:
+                self.refresh()
+
+    def contains(self, alarm_ids):
+        """Boolean mask: ids that have a dictionary entry."""
+        return self.state.contains(alarm_ids)
+
+    def table(self, key, fn):
+        """Per-id array of fn(alarm_name) for the current version."""
+        return self.state.table(key, fn)
+
+    def unit_categories(self, unit):
+        """Per-id failure-category bitmask for one unit's alarm lists, for the current version."""
+        return self.state.unit_categories(unit)
+
+
+alarm_dict = AlarmDict()
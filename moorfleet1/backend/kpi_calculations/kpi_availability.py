@@ -1,15 +1,9 @@
 # backend/kpi_calculations/kpi_availability.py
-import pymysql
-import pandas as pd
-from datetime import datetime, timedelta
-
-DB_CONFIG = {
-    'host': '127.0.0.1',
-    'user': 'root',
-    'password': 'U8NbpiQxGyemHJrB',
-    'database': 'ignitiondb',
-    'autocommit': True
-}
+import numpy as np
+
+from db import fetch_columns, get_connection
+from kpi_calculations.kpi_data import ALARM_COLUMNS, snapshot_window
+from kpi_calculations.kpi_intervals import OPEN_END, union_intervals, covered_between
 
 # Map units to tagpath_id / maintenance alarm id (adjust if your ids differ)
 UNITS = {
@@ -17,73 +11,92 @@ UNITS = {
     'U2': {'tagpath_id': '2', 'maint_alarm_id': 50}
 }
 
-DAYS_MAP = {'1D': 1, '7D': 7, '30D': 30, '1Y': 365}
-
-def _fetch_history_and_alarms(start_ts, end_ts):
-    conn = pymysql.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    # historical
-    cur.execute("""
-        SELECT dh.tagpath_id, dh.intvalue, dh.t_stamp
-        FROM cc_landing.data_historical dh
-        WHERE dh.t_stamp BETWEEN %s AND %s
-        ORDER BY dh.t_stamp
-    """, (int(start_ts), int(end_ts)))
-    hist_rows = cur.fetchall()
-    hist_cols = [desc[0] for desc in cur.description]
-    hist_df = pd.DataFrame(hist_rows, columns=hist_cols)
-    if not hist_df.empty:
-        hist_df['t_stamp'] = pd.to_datetime(hist_df['t_stamp'], unit='s', utc=True)
-
-    # alarms
-    cur.execute("""
-        SELECT da.alarm_id, da.eventtype, da.eventtime, dad.source
-        FROM cc_landing.data_alarms da
-        JOIN cc_landing.data_alarms_dict dad ON da.alarm_id = dad.id
-        WHERE da.eventtime BETWEEN %s AND %s
-        ORDER BY da.eventtime
-    """, (int(start_ts), int(end_ts)))
-    alarm_rows = cur.fetchall()
-    alarm_cols = [desc[0] for desc in cur.description]
-    alarm_df = pd.DataFrame(alarm_rows, columns=alarm_cols)
-    if not alarm_df.empty:
-        alarm_df['eventtime'] = pd.to_datetime(alarm_df['eventtime'], unit='s', utc=True)
-    conn.close()
-    return hist_df, alarm_df
-
-def _extract_alarm_name(source):
-    import re
-    if not isinstance(source, str):
-        return ""
-    m = re.search(r'/alm:(.+)$', source)
-    if m:
-        return m.group(1).strip()
-    # fallback: last token after ":" 
-    return source.split(':')[-1].strip()
-
-def calculate_AVAILABILITY_KPI(duration='1D', unit='U1'):
-    days = DAYS_MAP.get(duration, 30)
-    now = pd.Timestamp.utcnow()
-    start = now - pd.Timedelta(days=days)
-    start_ts = int(start.timestamp())
-    end_ts = int(now.timestamp())
-
-    hist_df, alarm_df = _fetch_history_and_alarms(start_ts, end_ts)
+NS_PER_SECOND = 10**9
+
 
+def maintenance_ids(unit):
     cfg = UNITS.get(unit)
     if not cfg:
         raise ValueError("Unknown unit: " + str(unit))
+    return [cfg['maint_alarm_id']]
+
+
+def _last_events_before(cursor, alarm_ids, ts):
+    """{alarm_id: (alarm_id, eventtype, eventtime)} of each alarm's last event before ts, in one query."""
+    placeholders = ", ".join(["%s"] * len(alarm_ids))
+    cursor.execute(f"""
+        SELECT da.alarm_id, da.eventtype, da.eventtime
+        FROM cc_landing.data_alarms da
+        JOIN (
+            SELECT alarm_id, MAX(eventtime) AS eventtime
+            FROM cc_landing.data_alarms
+            WHERE alarm_id IN ({placeholders}) AND eventtime < %s AND eventtype IN (0, 1)
+            GROUP BY alarm_id
+        ) latest ON latest.alarm_id = da.alarm_id AND latest.eventtime = da.eventtime
+        WHERE da.eventtype IN (0, 1)
+    """, (*alarm_ids, ts))
+    # Events sharing an alarm's latest time collapse to one, as LIMIT 1 would
+    return {row[0]: row for row in cursor.fetchall()}
+
+
+def maintenance_intervals(alarm_ids, start_ts, end_ts):
+    """Union of maintenance intervals overlapping [start_ts, end_ts] (epoch seconds) as ns arrays.
+
+    Only the given alarm ids are read: their events in the window plus the
+    last event before it, so maintenance already open at the start counts.
+    Per alarm, the first created event opens an interval and the first
+    cleared event closes it; one still open ends at OPEN_END.
+    """
+    events = fetch_columns(f"""
+        SELECT da.alarm_id, da.eventtype, da.eventtime
+        FROM cc_landing.data_alarms da
+        WHERE da.alarm_id IN ({", ".join(["%s"] * len(alarm_ids))})
+          AND da.eventtime BETWEEN %s AND %s
+          AND da.eventtype IN (0, 1)
+        ORDER BY da.eventtime
+    """, (*alarm_ids, start_ts, end_ts), ALARM_COLUMNS)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        prior = _last_events_before(cursor, alarm_ids, start_ts)
+        cursor.close()
+    finally:
+        conn.close()
+
+    starts, ends = [], []
+    for alarm_id in alarm_ids:
+        mine = events["alarm_id"] == alarm_id
+        before = [prior[alarm_id]] if alarm_id in prior else []
+        types = np.r_[[row[1] for row in before], events["eventtype"][mine]].astype(np.int8)
+        times = np.r_[[row[2] for row in before], events["eventtime"][mine]].astype(np.int64)
+        # Repeated created / cleared events do not move an interval's bounds
+        edge = np.r_[True, types[1:] != types[:-1]] if len(types) else np.zeros(0, dtype=bool)
+        types, times = types[edge], times[edge]
+        if len(types) and types[0] == 1:
+            types, times = types[1:], times[1:]
+        opened = times[types == 0] * NS_PER_SECOND
+        closed = times[types == 1] * NS_PER_SECOND
+        starts.append(opened)
+        ends.append(np.r_[closed, [OPEN_END] * (len(opened) - len(closed))].astype(np.int64))
+    return union_intervals(np.concatenate(starts), np.concatenate(ends))
+
+
+def availability_between(starts, ends, lo, hi):
+    """Percent of each [lo, hi] (ns) not covered by the maintenance intervals."""
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    period = hi - lo
+    covered = covered_between(starts, ends, lo, hi)
+    return [round(float(a), 2) for a in (period - covered) / period * 100.0]
+
 
-    # maintenance alarms count for this unit
-    if not alarm_df.empty:
-        alarm_df['alarm_name'] = alarm_df['source'].apply(_extract_alarm_name)
-        maint_mask = alarm_df['alarm_id'] == cfg['maint_alarm_id']
-        maint_events = alarm_df[maint_mask & (alarm_df['eventtype'] == 0)]
-        maint_count = len(maint_events)
+def calculate_AVAILABILITY_KPI(duration='1D', unit='U1', snapshot=None, end_time=None):
+    """Percent of the window the unit was not under maintenance."""
+    if snapshot is not None:
+        start, now = snapshot.start, snapshot.end
     else:
-        maint_count = 0
+        _, start, now = snapshot_window(duration, end_time)
+    ids = maintenance_ids(unit)
 
-    total_period = pd.Timedelta(days=days)
-    maint_duration = pd.to_timedelta(maint_count * 5 * 60, unit='s')  # 5 mins per event assumption
-    availability = ((total_period - maint_duration) / total_period) * 100.0
-    return round(float(availability), 2)
+    starts, ends = maintenance_intervals(ids, int(start.timestamp()), int(now.timestamp()))
+    return availability_between(starts, ends, [start.value], [now.value])[0]
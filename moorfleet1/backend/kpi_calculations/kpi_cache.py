@@ -0,0 +1,180 @@
+# kpi_calculations/kpi_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from db import get_connection
+from kpi_calculations.kpi_common import normalize_duration
+from utils import timing
+from utils.single_flight import SingleFlight
+
+# Window end alignment per canonical duration (seconds): every request inside
+# the same bucket shares one computed value.
+END_BUCKET = {"1D": 60, "7D": 300, "30D": 900, "1Y": 3600}
+
+# How long a cached value may be served (seconds)
+CACHE_TTL = {"1D": 60, "7D": 300, "30D": 900, "1Y": 3600}
+
+CACHE_MAX_ENTRIES = int(os.environ.get("MOORFLEET_KPI_CACHE_SIZE", "1024"))
+
+# Minimum seconds between two watermark queries
+WATERMARK_INTERVAL = float(os.environ.get("MOORFLEET_KPI_WATERMARK_INTERVAL", "5"))
+
+
+def bucket_end(duration, now=None):
+    """Align a window end down to its duration's bucket boundary."""
+    dur = normalize_duration(duration)
+    now = now or datetime.now(timezone.utc)
+    step = END_BUCKET[dur]
+    return datetime.fromtimestamp(int(now.timestamp()) // step * step, tz=timezone.utc)
+
+
+def fetch_watermark():
+    """Newest (data_historical.t_stamp, data_alarms.eventtime), both epoch seconds."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MAX(t_stamp) FROM cc_landing.data_historical")
+        (hist_max,) = cur.fetchone()
+        cur.execute("SELECT MAX(eventtime) FROM cc_landing.data_alarms")
+        (alarm_max,) = cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+    return (hist_max, alarm_max)
+
+
+class KPICache:
+    """Size-bounded LRU of KPI results keyed by (kpi, unit, duration, end bucket).
+
+    Each entry remembers the data watermark it was computed against. When the
+    watermark moves, entries whose window reaches past their old watermark
+    (i.e. could now contain new rows) are dropped; older windows stay valid.
+
+    Misses are single-flight: callers for a key already being computed wait
+    for that computation instead of starting their own.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL,
+                 watermark_fn=fetch_watermark, watermark_interval=WATERMARK_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.watermark_fn = watermark_fn
+        self.watermark_interval = watermark_interval
+        self._entries = OrderedDict()  # key -> (value, expires_at, watermark)
+        self._lock = threading.Lock()
+        self._watermark = None
+        self._watermark_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.flights = SingleFlight()
+
+    @staticmethod
+    def key(kpi, unit, duration, end_time=None):
+        dur = normalize_duration(duration)
+        return (kpi, unit, dur, int(bucket_end(dur, end_time).timestamp()))
+
+    def watermark(self):
+        """Current data watermark, re-queried at most every watermark_interval seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if self._watermark is not None and now - self._watermark_at < self.watermark_interval:
+                return self._watermark
+        wm = tuple(self.watermark_fn())
+        with self._lock:
+            self._watermark, self._watermark_at = wm, now
+        return wm
+
+    @staticmethod
+    def _stale(end_ts, entry_wm, current_wm):
+        for old, new in zip(entry_wm, current_wm):
+            if old == new:
+                continue
+            if old is None or new is None or new < old or end_ts > old:
+                return True
+        return False
+
+    def _lookup(self, key, wm):
+        """(hit, value) for a key, dropping it if expired or stale; called with the lock held."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, entry_wm = entry
+            if expires_at > time.monotonic() and not self._stale(key[3], entry_wm, wm):
+                self._entries.move_to_end(key)
+                return True, value
+            del self._entries[key]
+            self.invalidations += 1
+        return False, None
+
+    def get(self, key):
+        """Return (hit, value) for a key."""
+        wm = self.watermark()
+        with self._lock:
+            hit, value = self._lookup(key, wm)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return hit, value
+
+    def put(self, key, value, watermark=None):
+        wm = watermark if watermark is not None else self.watermark()
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl[key[2]], wm)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, kpi, unit, duration, compute, end_time=None):
+        """Serve a cached value or call ``compute(duration, window_end)`` and cache it.
+
+        Concurrent misses for one key share a single computation (errors are
+        propagated to every waiter, not cached).
+        """
+        key = self.key(kpi, unit, duration, end_time)
+        # Watermark taken before computing so late rows invalidate conservatively
+        wm = self.watermark()
+        hit, value = self.get(key)
+        if hit:
+            return value
+
+        def compute_once():
+            # A computation that finished since the miss above has already cached its value
+            with self._lock:
+                hit, value = self._lookup(key, wm)
+            if hit:
+                return value
+            value = compute(key[2], datetime.fromtimestamp(key[3], tz=timezone.utc))
+            self.put(key, value, wm)
+            return value
+
+        with timing.phase("compute"):
+            return self.flights.do(key, compute_once)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "coalesced": self.flights.coalesced,
+                "in_flight": self.flights.in_flight(),
+                "watermark": self._watermark
+            }
+
+
+kpi_cache = KPICache()
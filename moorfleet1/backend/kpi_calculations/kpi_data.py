@@ -0,0 +1,101 @@
+# kpi_calculations/kpi_data.py
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from db import fetch_columns
+from kpi_calculations.kpi_common import DUR_MAP, DUR_TO_DELTA
+from kpi_calculations.kpi_alarm_dict import alarm_dict
+
+# Typed columns the snapshot queries are decoded into; intvalue is read for every tag
+# (not only state tags), so it gets the full BIGINT range
+HISTORY_COLUMNS = [("tagpath_id", np.int32), ("intvalue", np.int64), ("t_stamp", np.int64)]
+ALARM_COLUMNS = [("alarm_id", np.int32), ("eventtype", np.int8), ("eventtime", np.int64)]
+
+
+@dataclass(frozen=True)
+class KPISnapshot:
+    """Window-bounded rows shared by the availability, MTBF and utilization KPIs.
+
+    ``history`` and ``alarms`` cover ``[start - lookback, end]``; calculators
+    clip to ``[start, end]`` themselves.
+    """
+    duration: str
+    start: pd.Timestamp
+    end: pd.Timestamp
+    lookback: timedelta
+    history: pd.DataFrame  # tagpath_id, intvalue, t_stamp
+    alarms: pd.DataFrame   # alarm_id, eventtype, eventtime, source, tag, alarm_name
+    alarm_dict: object = alarm_dict  # dictionary version the alarm rows were resolved against
+
+    def alarm_mask(self, alarms, key, fn):
+        """Row mask over an alarms frame from a cached per-id dictionary table."""
+        return self.alarm_dict.table(key, fn)[alarms['alarm_id'].to_numpy(dtype='int64')]
+
+    @property
+    def hours(self):
+        return (self.end - self.start) / pd.Timedelta(hours=1)
+
+
+def snapshot_window(duration, end_time=None):
+    """Return (canonical duration, start, end) for a duration code ending at end_time (default now)."""
+    dur = DUR_MAP.get(duration)
+    if dur is None:
+        raise ValueError(f"Invalid duration: {duration}")
+    end = pd.Timestamp(end_time or datetime.now(timezone.utc))
+    if end.tzinfo is None:
+        end = end.tz_localize("UTC")
+    return dur, end - DUR_TO_DELTA[dur], end
+
+
+def load_snapshot(duration, end_time=None, lookback=timedelta(0)):
+    """Fetch historical states and alarms for one KPI window (plus lookback).
+
+    The calculators only count samples and events inside the window, so no
+    lookback is read unless a caller asks for one.
+    """
+    dur, start, end = snapshot_window(duration, end_time)
+    from_ts = int((start - lookback).timestamp())
+    to_ts = int(end.timestamp())
+
+    # Streamed in chunks straight into compact typed arrays
+    history = fetch_columns("""
+        SELECT dh.tagpath_id, dh.intvalue, dh.t_stamp
+        FROM cc_landing.data_historical dh
+        WHERE dh.t_stamp BETWEEN %s AND %s
+        ORDER BY dh.t_stamp
+    """, (from_ts, to_ts), HISTORY_COLUMNS)
+    # Alarm attributes come from the cached dictionary, not a JOIN
+    alarms = fetch_columns("""
+        SELECT da.alarm_id, da.eventtype, da.eventtime
+        FROM cc_landing.data_alarms da
+        WHERE da.eventtime BETWEEN %s AND %s
+        ORDER BY da.eventtime
+    """, (from_ts, to_ts), ALARM_COLUMNS)
+
+    history = pd.DataFrame({
+        "tagpath_id": history["tagpath_id"],
+        "intvalue": history["intvalue"],
+        "t_stamp": pd.to_datetime(history["t_stamp"], unit="s", utc=True)
+    })
+
+    ids = alarms["alarm_id"].astype(np.int64)
+    alarm_dict.ensure(ids)
+    # One dictionary version for the whole snapshot, however often it is refreshed meanwhile
+    dictionary = alarm_dict.state
+    # Same rows the dictionary JOIN used to keep
+    known = dictionary.contains(ids)
+    if not known.all():
+        alarms = {name: values[known] for name, values in alarms.items()}
+        ids = ids[known]
+    alarms = pd.DataFrame({
+        "alarm_id": alarms["alarm_id"],
+        "eventtype": alarms["eventtype"],
+        "eventtime": pd.to_datetime(alarms["eventtime"], unit="s", utc=True),
+        "source": dictionary.source[ids],
+        "tag": dictionary.tag[ids],
+        "alarm_name": dictionary.alarm_name[ids]
+    })
+
+    return KPISnapshot(dur, start, end, lookback, history, alarms, dictionary)
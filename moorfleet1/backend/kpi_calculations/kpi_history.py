@@ -0,0 +1,142 @@
+# kpi_calculations/kpi_history.py
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+from kpi_calculations.kpi_common import DUR_TO_DELTA
+from kpi_calculations.kpi_data import load_snapshot, snapshot_window
+from kpi_calculations.kpi_availability import maintenance_ids, maintenance_intervals, availability_between
+from kpi_calculations.kpi_mtbf import UNIT_ALARM_RANGES, failure_tables
+from kpi_calculations.kpi_intervals import to_epoch_ns
+from kpi_calculations.kpi_utilization import moored_in_remote, NS_PER_HOUR
+
+# Chart point spacing per canonical duration
+HISTORY_STEP = {
+    "1D": timedelta(hours=1),
+    "7D": timedelta(days=1),
+    "30D": timedelta(days=1),
+    "1Y": timedelta(days=30)
+}
+
+NS_PER_SECOND = 10**9
+NS_PER_MS = 10**6
+
+
+def history_points(duration, end_time=None):
+    """Chart timestamps from now - duration to now (inclusive) for a duration code."""
+    dur, start, end = snapshot_window(duration, end_time)
+    count = int((end - start) / HISTORY_STEP[dur]) + 1
+    return dur, [start + i * HISTORY_STEP[dur] for i in range(count)]
+
+
+def load_history_snapshot(duration, end_time=None):
+    """One fetch covering the trailing window of every chart point."""
+    dur, _, _ = snapshot_window(duration, end_time)
+    return load_snapshot(dur, end_time, lookback=DUR_TO_DELTA[dur])
+
+
+def _window_counts(times, lo, hi):
+    """Events in [lo, hi] per bucket, plus the index of the first one."""
+    first = np.searchsorted(times, lo, side="left")
+    last = np.searchsorted(times, hi, side="right")
+    return last - first, first, last
+
+
+def _availability(unit, lo, hi):
+    # One read of the unit's maintenance alarms covers every point's window
+    starts, ends = maintenance_intervals(maintenance_ids(unit), int(lo.min() // NS_PER_SECOND),
+                                         int(hi.max() // NS_PER_SECOND))
+    return availability_between(starts, ends, lo, hi)
+
+
+def _mtbf(snapshot, unit, lo, hi):
+    if unit not in UNIT_ALARM_RANGES:
+        raise ValueError(f"Unknown unit name: {unit}")
+    # Same failure filter as calculate_MTBF_KPI
+    alarms = snapshot.alarms
+    is_failure, _ = failure_tables(snapshot, unit)
+    failures = alarms[is_failure[alarms['alarm_id'].to_numpy(dtype='int64')] & (alarms['eventtype'] == 0)]
+    times = np.sort(to_epoch_ns(failures['eventtime']))
+    count, first, last = _window_counts(times, lo, hi)
+    any_alarm, _, _ = _window_counts(to_epoch_ns(alarms['eventtime']), lo, hi)
+
+    mtbf = []
+    for n, i, j, end, seen in zip(count, first, last, hi, any_alarm):
+        if not seen or n == 0:
+            mtbf.append(None)
+        elif n == 1:
+            mtbf.append((end - times[i]) / NS_PER_SECOND / 3600)
+        else:
+            # mean of consecutive gaps == (last - first) / (n - 1)
+            mtbf.append((times[j - 1] - times[i]) / (n - 1) / NS_PER_SECOND / 3600)
+    return mtbf
+
+
+def _utilization(snapshot, unit, lo, hi):
+    history, alarms = snapshot.history, snapshot.alarms
+    is_remote = snapshot.alarm_mask(alarms, ("remote", unit), lambda name: name == f'{unit} in Remote')
+    remote = alarms[is_remote & alarms['eventtype'].isin([0, 1])]
+    ev_times = to_epoch_ns(remote['eventtime'])
+    ev_types = remote['eventtype'].to_numpy()
+    hist_ts = to_epoch_ns(history['t_stamp'])
+    hist_states = history['intvalue'].to_numpy()
+
+    # Closed Remote intervals are window independent: prefix-sum their Moored time
+    idx = np.flatnonzero((ev_types[:-1] == 0) & (ev_types[1:] == 1))
+    starts, ends = ev_times[idx], ev_times[idx + 1]
+    moored = moored_in_remote(hist_ts, hist_states, starts, ends)
+    cum = np.r_[0, np.cumsum(moored)]
+    used = cum[np.searchsorted(ends, hi, side="right")] - cum[np.searchsorted(starts, lo, side="right")]
+    used = np.maximum(used, 0)
+
+    # The last event inside (lo, hi] may be a created one still open at hi
+    last = np.searchsorted(ev_times, hi, side="right") - 1
+    open_mask = last >= 0
+    open_mask[open_mask] = (ev_times[last[open_mask]] > lo[open_mask]) & (ev_types[last[open_mask]] == 0)
+    if open_mask.any():
+        used[open_mask] += moored_in_remote(hist_ts, hist_states,
+                                            ev_times[last[open_mask]], hi[open_mask])
+
+    hours = (hi - lo) / NS_PER_HOUR
+    return [round(float(u), 2) if u else 0 for u in used / NS_PER_HOUR / hours * 100]
+
+
+def calculate_KPI_HISTORY_COLUMNS(duration, unit, end_time=None, snapshot=None):
+    """Availability, MTBF and utilization for every chart point in one sweep.
+
+    Each point covers the trailing ``duration`` window ending at its timestamp,
+    exactly like calling the three calculators once per point. Returned as
+    parallel columns: epoch-ms timestamps plus one list per KPI.
+    """
+    dur, points = history_points(duration, end_time)
+    if snapshot is None:
+        snapshot = load_history_snapshot(dur, end_time)
+
+    hi = np.array([p.value for p in points], dtype=np.int64)
+    lo = hi - pd.Timedelta(DUR_TO_DELTA[dur]).value
+
+    return {
+        "timestamp": hi // NS_PER_MS,
+        "uptime": _availability(unit, lo, hi),
+        "mtbf": _mtbf(snapshot, unit, lo, hi),
+        "utilization": _utilization(snapshot, unit, lo, hi)
+    }
+
+
+def history_rows(columns):
+    """One {timestamp (ISO), uptime, mtbf, utilization} dict per chart point."""
+    return [
+        {
+            "timestamp": pd.Timestamp(ms, unit="ms", tz="UTC").isoformat(),
+            "uptime": up,
+            "mtbf": mt,
+            "utilization": ut
+        }
+        for ms, up, mt, ut in zip(columns["timestamp"].tolist(), columns["uptime"],
+                                  columns["mtbf"], columns["utilization"])
+    ]
+
+
+def calculate_KPI_HISTORY(duration, unit, end_time=None, snapshot=None):
+    """Chart points as rows; see calculate_KPI_HISTORY_COLUMNS."""
+    return history_rows(calculate_KPI_HISTORY_COLUMNS(duration, unit, end_time, snapshot))
@@ -0,0 +1,101 @@
+# kpi_calculations/kpi_intervals.py
+import numpy as np
+
+# End marker for a run that is still open at the last sample
+OPEN_END = np.iinfo(np.int64).max
+
+
+def to_epoch_ns(series):
+    """UTC datetime Series -> int64 epoch nanoseconds."""
+    return series.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def state_runs(ts, states, value):
+    """Return (starts, ends) of consecutive samples equal to ``value``.
+
+    A run starts at the first matching sample and ends at the next
+    non-matching sample; a run still open at the last sample ends at OPEN_END.
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    hit = np.asarray(states) == value
+    if not hit.any():
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    first = np.flatnonzero(hit & ~np.r_[False, hit[:-1]])
+    miss = np.flatnonzero(~hit)
+    nxt = np.searchsorted(miss, first)
+    ends = np.full(len(first), OPEN_END, dtype=np.int64)
+    closed = nxt < len(miss)
+    ends[closed] = ts[miss[nxt[closed]]]
+    return ts[first], ends
+
+
+def pair_intervals(times, types, end):
+    """Pair created (0) / cleared (1) events into intervals.
+
+    Mirrors the sequential scan: a created event (re)opens the interval, a
+    cleared event closes it, anything else is ignored; an interval still
+    open after the last event runs until ``end``.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    types = np.asarray(types)
+    keep = (types == 0) | (types == 1)
+    times, types = times[keep], types[keep]
+    if not len(times):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    idx = np.flatnonzero((types[:-1] == 0) & (types[1:] == 1))
+    starts, ends = times[idx], times[idx + 1]
+    if types[-1] == 0:
+        starts = np.r_[starts, times[-1]]
+        ends = np.r_[ends, np.int64(end)]
+    return starts, ends
+
+
+def union_intervals(starts, ends):
+    """Merge possibly overlapping intervals into sorted, disjoint ones."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    first = np.flatnonzero(np.r_[True, starts[1:] > reach[:-1]])
+    return starts[first], np.maximum.reduceat(ends, first)
+
+
+def intersect_intervals(starts_a, ends_a, starts_b, ends_b):
+    """Overlaps of two sets of sorted, disjoint intervals (sorted and disjoint too)."""
+    starts_a, ends_a = np.asarray(starts_a, dtype=np.int64), np.asarray(ends_a, dtype=np.int64)
+    starts_b, ends_b = np.asarray(starts_b, dtype=np.int64), np.asarray(ends_b, dtype=np.int64)
+    # Per interval of a, the run of b intervals overlapping it
+    first = np.searchsorted(ends_b, starts_a, side="right")
+    count = np.maximum(np.searchsorted(starts_b, ends_a, side="left") - first, 0)
+    i = np.repeat(np.arange(len(starts_a)), count)
+    j = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count) + np.repeat(first, count)
+    starts = np.maximum(starts_a[i], starts_b[j])
+    ends = np.minimum(ends_a[i], ends_b[j])
+    keep = ends > starts
+    return starts[keep], ends[keep]
+
+
+def covered_upto(starts, ends, t):
+    """Total length of the sorted, disjoint runs lying in (-inf, t], per t."""
+    t = np.asarray(t, dtype=np.int64)
+    if not len(starts):
+        return np.zeros(t.shape, dtype=np.int64)
+    cum = np.r_[0, np.cumsum(ends - starts)]
+    k = np.searchsorted(starts, t, side="right")
+    last = np.maximum(k - 1, 0)
+    excess = np.where(k > 0, np.clip(ends[last] - t, 0, None), 0)
+    return cum[k] - excess
+
+
+def covered_between(starts, ends, a, b):
+    """Total length of the runs inside each query interval [a, b]."""
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    if not len(b):
+        return np.zeros(0, dtype=np.int64)
+    # Open runs never extend past the last query bound
+    ends = np.maximum(np.minimum(ends, b.max()), starts)
+    return np.clip(covered_upto(starts, ends, b) - covered_upto(starts, ends, a), 0, None)
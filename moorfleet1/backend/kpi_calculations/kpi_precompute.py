@@ -0,0 +1,168 @@
+# kpi_calculations/kpi_precompute.py
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from db import get_connection
+from kpi_calculations.kpi_availability import calculate_AVAILABILITY_KPI
+from kpi_calculations.kpi_cache import CACHE_TTL, END_BUCKET, bucket_end
+from kpi_calculations.kpi_common import DUR_TO_DELTA
+from kpi_calculations.kpi_data import load_snapshot
+from kpi_calculations.kpi_mtbf import calculate_MTBF_KPI
+from kpi_calculations.kpi_utilization import calculate_UTIL_KPI
+
+KPI_HISTORY_TABLE = os.environ.get("MOORFLEET_KPI_HISTORY_TABLE", "cc_dw.kpi_history")
+PRECOMPUTE_ENABLED = os.environ.get("MOORFLEET_KPI_PRECOMPUTE", "1") == "1"
+# Buckets a precomputed row may lag behind the current window end and still be served
+PRECOMPUTE_MAX_LAG = int(os.environ.get("MOORFLEET_KPI_PRECOMPUTE_MAX_LAG", "1"))
+# Named MySQL lock per duration: one scheduler computes a duration at a time across processes
+PRECOMPUTE_LOCK = "moorfleet_kpi_precompute"
+# Rows older than the longest window before the newest one are pruned
+HISTORY_RETENTION = max(DUR_TO_DELTA.values())
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {KPI_HISTORY_TABLE} (
+        unit VARCHAR(16) NOT NULL,
+        duration VARCHAR(8) NOT NULL,
+        window_end DATETIME NOT NULL,
+        computed_at DATETIME NOT NULL,
+        availability DOUBLE NULL,
+        mtbf DOUBLE NULL,
+        mtbf_details TEXT NULL,
+        utilization DOUBLE NULL,
+        PRIMARY KEY (unit, duration, window_end)
+    )
+"""
+
+
+def _naive_utc(value):
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def latest_row(unit, duration, now=None):
+    """Newest precomputed KPIs for (unit, duration) if recent enough to serve, else None."""
+    cutoff = bucket_end(duration, now) - timedelta(seconds=END_BUCKET[duration] * PRECOMPUTE_MAX_LAG)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT unit, duration, window_end, availability, mtbf, mtbf_details, utilization
+            FROM {KPI_HISTORY_TABLE}
+            WHERE unit = %s AND duration = %s
+            ORDER BY window_end DESC
+            LIMIT 1
+        """, (unit, duration))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    if row is None or row["window_end"] < _naive_utc(cutoff):
+        return None
+    return {
+        "unit": row["unit"],
+        "duration": row["duration"],
+        "availability": row["availability"],
+        "mtbf": row["mtbf"],
+        "mtbf_details": json.loads(row["mtbf_details"]) if row["mtbf_details"] else {},
+        "utilization": row["utilization"]
+    }
+
+
+def compute_window(duration, units, window_end):
+    """KPI rows for every unit over one window; one snapshot is shared by all of them."""
+    snapshot = load_snapshot(duration, window_end)
+    computed_at = _naive_utc(datetime.now(timezone.utc))
+    rows = []
+    for unit in units:
+        try:
+            mtbf, mtbf_details = calculate_MTBF_KPI(duration, unit, snapshot=snapshot)
+            rows.append((unit, duration, _naive_utc(window_end), computed_at,
+                         calculate_AVAILABILITY_KPI(duration, unit, snapshot=snapshot),
+                         mtbf, json.dumps(mtbf_details),
+                         calculate_UTIL_KPI(duration, unit, snapshot=snapshot)))
+        except Exception:
+            logger.exception("KPI precompute failed for %s %s", unit, duration)
+    return rows
+
+
+class KPIPrecompute:
+    """Background scheduler writing availability, MTBF and utilization to the KPI history table.
+
+    Each canonical duration has its own thread and is recomputed whenever its
+    window end moves to a new bucket (see kpi_cache.END_BUCKET), for every
+    unit, so a slow 1Y window never delays 1D. Rows older than
+    HISTORY_RETENTION before the newest window are pruned as it goes.
+    """
+
+    def __init__(self, units, interval=5):
+        self.units = list(units)
+        self.interval = interval
+        self.done = {}  # duration -> last window end written
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def run_once(self, durations=None, now=None):
+        """Compute the given durations (default: all) whose window end moved to a new bucket."""
+        for dur in durations or DUR_TO_DELTA:
+            window_end = bucket_end(dur, now)
+            if self.done.get(dur) != window_end:
+                self._compute(dur, window_end)
+
+    def _compute(self, dur, window_end):
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            lock = f"{PRECOMPUTE_LOCK}_{dur}"
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (lock,))
+            (locked,) = cursor.fetchone()
+            if not locked:
+                return  # another process is computing this duration
+            try:
+                cursor.execute(SCHEMA)
+                rows = compute_window(dur, self.units, window_end)
+                if rows:
+                    cursor.executemany(f"""
+                        REPLACE INTO {KPI_HISTORY_TABLE}
+                            (unit, duration, window_end, computed_at, availability, mtbf, mtbf_details, utilization)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """, rows)
+                if self.units:
+                    cursor.execute(f"""
+                        DELETE FROM {KPI_HISTORY_TABLE}
+                        WHERE unit IN ({", ".join(["%s"] * len(self.units))})
+                          AND duration = %s AND window_end < %s
+                    """, (*self.units, dur, _naive_utc(window_end - HISTORY_RETENTION)))
+                self.done[dur] = window_end
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (lock,))
+                cursor.fetchone()
+                cursor.close()
+        finally:
+            conn.close()
+
+    def _run(self, dur):
+        while True:
+            try:
+                self.run_once([dur])
+            except Exception:
+                logger.exception("KPI precompute failed for %s", dur)
+            # Wake at the duration's next bucket boundary
+            period = CACHE_TTL[dur]
+            time.sleep(max(period - time.time() % period, self.interval))
+
+    def start(self):
+        """Start one scheduler thread per duration once (unless disabled via MOORFLEET_KPI_PRECOMPUTE=0)."""
+        if not PRECOMPUTE_ENABLED:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for dur in DUR_TO_DELTA:
+                self._threads[dur] = threading.Thread(target=self._run, args=(dur,),
+                                                      name=f"kpi-precompute-{dur}", daemon=True)
+                self._threads[dur].start()
@@ -0,0 +1,412 @@
+# kpi_calculations/kpi_rollup.py
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from db import fetch_columns, get_connection
+from kpi_calculations.kpi_alarm_dict import alarm_dict
+from kpi_calculations.kpi_availability import UNITS, maintenance_ids, maintenance_intervals
+from kpi_calculations.kpi_data import ALARM_COLUMNS
+from kpi_calculations.kpi_intervals import OPEN_END, state_runs, intersect_intervals, covered_between
+from kpi_calculations.kpi_mtbf import mentions
+from kpi_calculations.kpi_utilization import MOORED_STATE
+from utils.mooring_states import MOORING_STATES
+from utils.state_runs import StateRuns
+
+KPI_ROLLUP_TABLE = os.environ.get("MOORFLEET_KPI_ROLLUP_TABLE", "cc_dw.kpi_rollup")
+ROLLUP_ENABLED = os.environ.get("MOORFLEET_KPI_ROLLUP", "1") == "1"
+ROLLUP_BACKFILL = timedelta(days=int(os.environ.get("MOORFLEET_KPI_ROLLUP_BACKFILL_DAYS", "400")))
+# Days of hours a single run may roll up; a longer backfill continues on the next runs
+ROLLUP_DAYS_PER_RUN = int(os.environ.get("MOORFLEET_KPI_ROLLUP_DAYS_PER_RUN", "7"))
+# Seconds after an hour ends before it is rolled up; later rows are read raw at the window edge
+ROLLUP_SETTLE = int(os.environ.get("MOORFLEET_KPI_ROLLUP_SETTLE", "600"))
+# Trailing seconds of rolled hours recomputed on every run, so rows that land late are picked up
+ROLLUP_REROLL = int(os.environ.get("MOORFLEET_KPI_ROLLUP_REROLL", str(86400 + 3600)))
+# Named MySQL lock: one process maintains the rollups at a time
+ROLLUP_LOCK = "moorfleet_kpi_rollup"
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 86400
+NS_PER_SECOND = 10**9
+
+# Metrics combined by MIN / MAX across buckets; every other metric is summed
+FIRST_METRICS = ("failure_first",)
+LAST_METRICS = ("failure_last",)
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {KPI_ROLLUP_TABLE} (
+        unit VARCHAR(16) NOT NULL,
+        resolution INT NOT NULL,
+        bucket_start BIGINT NOT NULL,
+        metric VARCHAR(32) NOT NULL,
+        value DOUBLE NOT NULL,
+        PRIMARY KEY (unit, resolution, bucket_start, metric)
+    )
+"""
+
+STATE_COLUMNS = [("intvalue", np.int64), ("t_stamp", np.int64)]
+
+
+def floor_to(ts, step):
+    return ts // step * step
+
+
+def ceil_to(ts, step):
+    return -(-ts // step) * step
+
+
+def _unit_samples(unit, lo, hi):
+    """State samples of a unit in [lo, hi), led by the one in force at lo."""
+    tagpath_id = UNITS[unit]["tagpath_id"]
+    prior = fetch_columns("""
+        SELECT dh.intvalue, dh.t_stamp
+        FROM cc_landing.data_historical dh
+        WHERE dh.tagpath_id = %s AND dh.t_stamp < %s
+        ORDER BY dh.t_stamp DESC
+        LIMIT 1
+    """, (tagpath_id, lo), STATE_COLUMNS)
+    samples = fetch_columns("""
+        SELECT dh.intvalue, dh.t_stamp
+        FROM cc_landing.data_historical dh
+        WHERE dh.tagpath_id = %s AND dh.t_stamp >= %s AND dh.t_stamp < %s
+        ORDER BY dh.t_stamp
+    """, (tagpath_id, lo, hi), STATE_COLUMNS)
+    return (np.r_[prior["t_stamp"], samples["t_stamp"]].astype(np.int64),
+            np.r_[prior["intvalue"], samples["intvalue"]].astype(np.int64))
+
+
+def _alarm_ids(unit):
+    """(Remote alarm ids, failure alarm ids) of a unit, as the KPI calculators select them."""
+    alarm_dict.ensure([])
+    dictionary = alarm_dict.state
+    remote = np.flatnonzero(dictionary.table(("remote", unit), lambda name: name == f'{unit} in Remote'))
+    failure = np.flatnonzero(dictionary.table(("mentions", unit), lambda name: mentions(name, unit)))
+    return remote, failure
+
+
+def _held_intervals(alarm_ids, lo, hi):
+    """(starts, ends) epoch s the alarms were active in [lo, hi), as maintenance_intervals pairs them."""
+    if not len(alarm_ids):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    starts, ends = maintenance_intervals([int(alarm_id) for alarm_id in alarm_ids], lo, hi)
+    return starts // NS_PER_SECOND, np.where(ends == OPEN_END, hi, ends // NS_PER_SECOND)
+
+
+def raw_metrics(unit, edges):
+    """Metrics per bucket [edges[i], edges[i + 1]) (epoch s) from the landing tables.
+
+    ``state_<code>``, ``observed``, ``remote``, ``moored_remote`` and
+    ``maintenance`` are seconds; ``failures`` and ``maintenance_events`` count
+    created events; ``failure_first`` / ``failure_last`` are epoch seconds
+    (NaN without failures). States are held from one sample to the next.
+    """
+    edges = np.asarray(edges, dtype=np.int64)
+    lo, hi = int(edges[0]), int(edges[-1])
+    a, b = edges[:-1], edges[1:]
+    metrics = {}
+
+    ts, states = _unit_samples(unit, lo, hi)
+    runs = StateRuns()
+    runs.extend(ts, states)
+    observed = np.zeros(len(a), dtype=np.int64)
+    for state in np.unique(states):
+        spent = runs.time_in_state(int(state), a, b)
+        metrics[f"state_{int(state)}"] = spent
+        observed += spent
+    metrics["observed"] = observed
+
+    remote_ids, failure_ids = _alarm_ids(unit)
+    maint_ids = maintenance_ids(unit)
+    ids = np.union1d(failure_ids, maint_ids).tolist()
+    events = fetch_columns(f"""
+        SELECT da.alarm_id, da.eventtype, da.eventtime
+        FROM cc_landing.data_alarms da
+        WHERE da.alarm_id IN ({", ".join(["%s"] * len(ids))})
+          AND da.eventtime >= %s AND da.eventtime < %s
+          AND da.eventtype IN (0, 1)
+        ORDER BY da.eventtime
+    """, (*ids, lo, hi), ALARM_COLUMNS)
+
+    # Held from each created event to the next cleared one, so every hour rolls up the same
+    # way whatever window it is read in (the Remote pairing of calculate_UTIL_KPI depends on it)
+    remote_starts, remote_ends = _held_intervals(remote_ids, lo, hi)
+    metrics["remote"] = covered_between(remote_starts, remote_ends, a, b)
+    moored_starts, moored_ends = state_runs(ts, states, MOORED_STATE)
+    metrics["moored_remote"] = covered_between(
+        *intersect_intervals(moored_starts, np.minimum(moored_ends, hi), remote_starts, remote_ends), a, b)
+    maint_starts, maint_ends = _held_intervals(maint_ids, lo, hi)
+    metrics["maintenance"] = covered_between(maint_starts, maint_ends, a, b)
+
+    created = events["eventtype"] == 0
+    failures = events["eventtime"][created & np.isin(events["alarm_id"], failure_ids)].astype(np.int64)
+    first = np.searchsorted(failures, a, side="left")
+    last = np.searchsorted(failures, b, side="left")
+    metrics["failures"] = last - first
+    has = last > first
+    metrics["failure_first"] = np.where(has, failures[np.minimum(first, len(failures) - 1)] if len(failures) else 0,
+                                        np.nan)
+    metrics["failure_last"] = np.where(has, failures[np.maximum(last - 1, 0)] if len(failures) else 0, np.nan)
+    maint_created = events["eventtime"][created & np.isin(events["alarm_id"], maint_ids)].astype(np.int64)
+    metrics["maintenance_events"] = (np.searchsorted(maint_created, b, side="left")
+                                     - np.searchsorted(maint_created, a, side="left"))
+    return metrics
+
+
+def _combine(out, size, metric, index, values):
+    """Fold per-piece values into the ``size`` output buckets at ``index``."""
+    values = np.asarray(values, dtype=np.float64)
+    if metric not in out:
+        out[metric] = np.full(size, np.nan if metric in FIRST_METRICS + LAST_METRICS else 0.0)
+    if metric in FIRST_METRICS:
+        np.fmin.at(out[metric], index, values)
+    elif metric in LAST_METRICS:
+        np.fmax.at(out[metric], index, values)
+    else:
+        np.add.at(out[metric], index, values)
+
+
+def bucket_edges(start, end, bucket=None):
+    """Window edges (epoch s): multiples of ``bucket`` since the epoch, clipped to [start, end)."""
+    if bucket is None:
+        return np.array([start, end], dtype=np.int64)
+    inner = np.arange(floor_to(start, bucket) + bucket, end, bucket, dtype=np.int64)
+    return np.r_[start, inner[inner > start], end].astype(np.int64)
+
+
+def rolled_ranges(unit):
+    """{resolution: (first bucket start, end of the last bucket)} of the rollups stored for a unit."""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT resolution, MIN(bucket_start), MAX(bucket_start)
+            FROM {KPI_ROLLUP_TABLE}
+            WHERE unit = %s
+            GROUP BY resolution
+        """, (unit,))
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return {int(resolution): (int(first), int(last) + int(resolution)) for resolution, first, last in rows}
+
+
+def _rollup_pieces(start, end, ranges, use_days):
+    """([(resolution, lo, hi)] served from rollups, [(lo, hi)] read raw)."""
+    if HOUR not in ranges:
+        return [], [(start, end)]
+    hours = (max(ceil_to(start, HOUR), ranges[HOUR][0]), min(floor_to(end, HOUR), ranges[HOUR][1]))
+    if hours[0] >= hours[1]:
+        return [], [(start, end)]
+    raw = [(lo, hi) for lo, hi in ((start, hours[0]), (hours[1], end)) if lo < hi]
+    days = None
+    if use_days and DAY in ranges:
+        days = (max(ceil_to(hours[0], DAY), ranges[DAY][0]), min(floor_to(hours[1], DAY), ranges[DAY][1]))
+    if days is None or days[0] >= days[1]:
+        return [(HOUR, *hours)], raw
+    rolled = [(DAY, *days)] + [(HOUR, lo, hi) for lo, hi in ((hours[0], days[0]), (days[1], hours[1])) if lo < hi]
+    return rolled, raw
+
+
+def window_metrics(unit, start, end, bucket=None):
+    """Metrics per output bucket over [start, end) (epoch s).
+
+    Whole hours and days come from the rollup table; only the parts of the
+    window outside the rolled-up range (its edges, and anything not rolled up
+    yet) are computed from raw rows. ``bucket`` must be a multiple of an hour.
+    Returns (edges, {metric: array per bucket}).
+    """
+    if unit not in UNITS:
+        raise ValueError(f"Unknown unit: {unit}")
+    edges = bucket_edges(start, end, bucket)
+    size, out = len(edges) - 1, {}
+    try:
+        ranges = rolled_ranges(unit)
+    except Exception as e:
+        logger.warning("KPI rollup lookup failed: %s", e)
+        ranges = {}  # e.g. table not created yet: everything is read raw
+    rolled, raw = _rollup_pieces(start, end, ranges, bucket is None or bucket % DAY == 0)
+
+    if rolled:
+        where = " OR ".join(["(resolution = %s AND bucket_start >= %s AND bucket_start < %s)"] * len(rolled))
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT bucket_start, metric, value
+                FROM {KPI_ROLLUP_TABLE}
+                WHERE unit = %s AND ({where})
+            """, (unit, *[value for piece in rolled for value in piece]))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        by_metric = {}
+        for bucket_start, metric, value in rows:
+            by_metric.setdefault(metric, ([], []))
+            by_metric[metric][0].append(bucket_start)
+            by_metric[metric][1].append(value)
+        for metric, (starts, values) in by_metric.items():
+            _combine(out, size, metric, np.searchsorted(edges, starts, side="right") - 1, values)
+
+    for lo, hi in raw:
+        inner = edges[(edges > lo) & (edges < hi)]
+        sub = np.r_[lo, inner, hi].astype(np.int64)
+        index = np.searchsorted(edges, sub[:-1], side="right") - 1
+        for metric, values in raw_metrics(unit, sub).items():
+            _combine(out, size, metric, index, values)
+    return edges, out
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(int(ts), tz=timezone.utc).isoformat()
+
+
+def window_kpis(unit, start, end, bucket=None):
+    """Availability, utilization, MTBF and time per state for each bucket of [start, end) (epoch s).
+
+    Availability and utilization follow the KPI calculators over the bucket
+    length; Moored time inside Remote intervals is held from sample to
+    sample, so it can differ slightly from calculate_UTIL_KPI at interval
+    boundaries.
+    """
+    edges, metrics = window_metrics(unit, start, end, bucket)
+    zeros = np.zeros(len(edges) - 1)
+    failures = metrics.get("failures", zeros)
+    first, last = metrics.get("failure_first", zeros), metrics.get("failure_last", zeros)
+    states = sorted(int(metric[len("state_"):]) for metric in metrics if metric.startswith("state_"))
+    buckets = []
+    for i, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+        seconds = hi - lo
+        n = int(failures[i])
+        if n >= 2:
+            mtbf = float((last[i] - first[i]) / (n - 1) / 3600)
+        elif n == 1:
+            mtbf = float((hi - first[i]) / 3600)
+        else:
+            mtbf = None
+        buckets.append({
+            "start": _iso(lo),
+            "end": _iso(hi),
+            "availability": round(float((seconds - metrics.get("maintenance", zeros)[i]) / seconds * 100), 2),
+            "utilization": round(float(metrics.get("moored_remote", zeros)[i] / seconds * 100), 2),
+            "mtbf": mtbf,
+            "failures": n,
+            "maintenance_events": int(metrics.get("maintenance_events", zeros)[i]),
+            "remote_seconds": int(metrics.get("remote", zeros)[i]),
+            "maintenance_seconds": int(metrics.get("maintenance", zeros)[i]),
+            "states": [
+                {"state_code": state, "state": MOORING_STATES.get(state, "Unknown"),
+                 "seconds": int(metrics[f"state_{state}"][i])}
+                for state in states if metrics[f"state_{state}"][i]
+            ]
+        })
+    return buckets
+
+
+class KPIRollup:
+    """Background maintainer of hourly and daily KPI rollups per unit.
+
+    Each settled hour is computed from raw rows; a day is summed from its
+    24 hours once they are all present. The last ROLLUP_REROLL seconds of
+    hours are recomputed on every run, along with the days they fall in.
+    The first runs backfill ROLLUP_BACKFILL, at most ROLLUP_DAYS_PER_RUN
+    days of hours each, oldest first.
+    """
+
+    def __init__(self, units, interval=60):
+        self.units = [unit for unit in units if unit in UNITS]
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _write_hours(self, cursor, unit, edges):
+        metrics = raw_metrics(unit, edges)
+        rows = [(unit, HOUR, int(bucket_start), metric, float(values[i]))
+                for metric, values in metrics.items()
+                for i, bucket_start in enumerate(edges[:-1]) if not np.isnan(values[i])]
+        cursor.executemany(f"""
+            REPLACE INTO {KPI_ROLLUP_TABLE} (unit, resolution, bucket_start, metric, value)
+            VALUES (%s, %s, %s, %s, %s)
+        """, rows)
+
+    def roll_unit(self, conn, cursor, unit, now):
+        ranges = rolled_ranges(unit)
+        if HOUR in ranges:
+            rolled_end = ranges[HOUR][1]
+            start = max(floor_to(rolled_end - ROLLUP_REROLL, HOUR), ranges[HOUR][0])
+        else:
+            rolled_end = start = floor_to(now - int(ROLLUP_BACKFILL.total_seconds()), DAY)
+        rerolled = start
+        stop = min(floor_to(now - ROLLUP_SETTLE, HOUR), floor_to(rolled_end, DAY) + ROLLUP_DAYS_PER_RUN * DAY)
+        # One raw read per day of hours, committed as it goes
+        while start < stop:
+            chunk_end = min(floor_to(start, DAY) + DAY, stop)
+            self._write_hours(cursor, unit, np.arange(start, chunk_end + 1, HOUR, dtype=np.int64))
+            conn.commit()
+            start = chunk_end
+
+        ranges = rolled_ranges(unit)
+        if HOUR not in ranges:
+            return
+        day_from = ceil_to(ranges[HOUR][0], DAY)
+        if DAY in ranges:
+            # Days holding a recomputed hour are summed again
+            day_from = max(min(ranges[DAY][1], floor_to(rerolled, DAY)), day_from)
+        day_to = floor_to(ranges[HOUR][1], DAY)
+        if day_from < day_to:
+            cursor.execute(f"""
+                REPLACE INTO {KPI_ROLLUP_TABLE} (unit, resolution, bucket_start, metric, value)
+                SELECT unit, %s, bucket_start - MOD(bucket_start, %s), metric,
+                       CASE WHEN metric IN ({", ".join(["%s"] * len(FIRST_METRICS))}) THEN MIN(value)
+                            WHEN metric IN ({", ".join(["%s"] * len(LAST_METRICS))}) THEN MAX(value)
+                            ELSE SUM(value) END
+                FROM {KPI_ROLLUP_TABLE}
+                WHERE unit = %s AND resolution = %s AND bucket_start >= %s AND bucket_start < %s
+                GROUP BY unit, bucket_start - MOD(bucket_start, %s), metric
+            """, (DAY, DAY, *FIRST_METRICS, *LAST_METRICS, unit, HOUR, day_from, day_to, DAY))
+            conn.commit()
+
+    def run_once(self, now=None):
+        now = int(now if now is not None else time.time())
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (ROLLUP_LOCK,))
+            (locked,) = cursor.fetchone()
+            if not locked:
+                return  # another process is rolling up
+            try:
+                cursor.execute(SCHEMA)
+                alarm_dict.refresh()
+                for unit in self.units:
+                    self.roll_unit(conn, cursor, unit, now)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (ROLLUP_LOCK,))
+                cursor.fetchone()
+                cursor.close()
+        finally:
+            conn.close()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("KPI rollup failed")
+            time.sleep(self.interval)
+
+    def start(self):
+        """Start the maintainer thread once (unless disabled via MOORFLEET_KPI_ROLLUP=0)."""
+        if not ROLLUP_ENABLED:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="kpi-rollup", daemon=True)
+                self._thread.start()
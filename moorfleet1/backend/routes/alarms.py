@@ -1,6 +1,12 @@
+import itertools
+import os
+import re
+import time
 from flask import Blueprint, jsonify, request
 from db import get_connection
 from datetime import datetime, timedelta, timezone
+from utils.alarm_sources import AlarmSourceIndex
+from utils.http_cache import make_etag, not_modified, tag
 
 alarms_bp = Blueprint("alarms", __name__, url_prefix="/api/alarms")
 
@@ -59,6 +65,48 @@ def extract_unit_id(source):
     except:
         return None
 
+_MOOR_UNIT_RE = re.compile(r"MoorUnit(\d+)/")
+
+def attribute_source(source):
+    """Display unit ID an alarm source belongs to (MoorUnit<tagid>/ paths first)"""
+    m = _MOOR_UNIT_RE.search(source)
+    if m and int(m.group(1)) in UNIT_ID_MAPPING.values():
+        return get_display_id(int(m.group(1)))
+    return extract_unit_id(source)
+
+# Alarms hidden from the recent lists
+EXCLUDED_ALARM = "Ramp/Ramp3:/alm:High Alarm"
+
+# Unit attribution resolved once per distinct source
+alarm_sources = AlarmSourceIndex(attribute_source, lambda source: EXCLUDED_ALARM in source)
+
+# Batch acknowledge/clear: target event types and ids per UPDATE
+BATCH_ACTIONS = {
+    "acknowledge": 2,
+    "clear": 1
+}
+BATCH_CHUNK = 500
+
+# Keyset pagination: ?before=<eventtime>,<id>&limit=<n>
+PAGE_SIZE = 10
+PAGE_MAX = 500
+
+# Longest source list put into an IN / NOT IN; past it rows are filtered after reading,
+# RECENT_SCAN_BATCH rows per query
+RECENT_IN_MAX = int(os.environ.get("MOORFLEET_ALARM_SOURCES_IN_MAX", "500"))
+RECENT_SCAN_BATCH = 1000
+
+# Recent lists revalidate against the newest alarm id and local acknowledge/clear
+# updates; timeAgo text drifts, so an ETag is also only good for this many seconds
+RECENT_ETAG_SECONDS = int(os.environ.get("MOORFLEET_ALARM_ETAG_SECONDS", "10"))
+_alarm_changes = itertools.count(1)
+alarm_version = 0
+
+def mark_changed():
+    """Invalidate recent-list ETags after alarms were updated in place"""
+    global alarm_version
+    alarm_version = next(_alarm_changes)
+
 def time_ago(eventtime):
     # Make eventtime timezone-aware (local -> UTC)
     if eventtime.tzinfo is None:
@@ -83,21 +131,80 @@ def time_ago(eventtime):
     else:
         return f"{seconds // 86400} days ago"
 
-@alarms_bp.route("/recent", methods=['GET'])
-def recent_all_units():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
+def parse_page_args(args):
+    """(before, limit) from query args; raises ValueError on bad input"""
+    limit = int(args.get("limit", PAGE_SIZE))
+    if not 1 <= limit <= PAGE_MAX:
+        raise ValueError(f"limit must be between 1 and {PAGE_MAX}")
+    before = args.get("before")
+    if before:
+        eventtime, _, alarm_id = before.rpartition(",")
+        before = (datetime.fromisoformat(eventtime), int(alarm_id))
+    return before, limit
+
+def recent_filter(display_id=None):
+    """(where, params, keep) selecting one unit's alarms (all units if None); None if it has none
+
+    Source lists longer than RECENT_IN_MAX stay out of the SQL: ``keep(source)``
+    then picks the rows to return (it is None when the SQL selects exactly).
+    """
+    if display_id is None:
+        where, params = ["source IS NOT NULL"], []
+        excluded = alarm_sources.excluded_sources()
+        if len(excluded) > RECENT_IN_MAX:
+            excluded = set(excluded)
+            return where, params, lambda source: source not in excluded
+        if excluded:
+            where.append(f"source NOT IN ({', '.join(['%s'] * len(excluded))})")
+            params.extend(excluded)
+        return where, params, None
+    # Sources attributed to this unit (MoorUnit<tagid>/, U<n>, Ux), resolved once each
+    sources = alarm_sources.sources_for(display_id)
+    if not sources:
+        return None
+    if len(sources) > RECENT_IN_MAX:
+        sources = set(sources)
+        return ["source IS NOT NULL"], [], lambda source: source in sources
+    return [f"source IN ({', '.join(['%s'] * len(sources))})"], list(sources), None
+
+def page_query(where, params, before, limit):
+    """SQL and params for one page of alarm events, newest first, strictly older than the cursor"""
+    if before:
+        where = [*where, "(eventtime < %s OR (eventtime = %s AND id < %s))"]
+        params = [*params, before[0], before[0], before[1]]
+    return f"""
         SELECT id, source, priority, eventtime, eventtype
         FROM ignitiondb.alarm_events
-        WHERE source NOT LIKE %s
-        ORDER BY eventtime DESC
-        LIMIT 10
-    """, ("%Ramp/Ramp3:/alm:High Alarm%",))
-    rows = cursor.fetchall()
-    conn.close()
-
-    return jsonify([
+        WHERE {" AND ".join(where)}
+        ORDER BY eventtime DESC, id DESC
+        LIMIT %s
+    """, (*params, limit)
+
+def page_scan(where, params, keep, before, limit):
+    """Queries for one page of rows: send each query's rows back in; returns the page rows
+
+    Without ``keep`` this is the single page query. Otherwise batches are read
+    newest first, continuing from the oldest row read, until ``limit`` rows are
+    kept or the table runs out.
+    """
+    if keep is None:
+        return (yield page_query(where, params, before, limit))
+    kept = []
+    while True:
+        rows = yield page_query(where, params, before, RECENT_SCAN_BATCH)
+        kept.extend(row for row in rows if keep(row["source"]))
+        if len(kept) >= limit or len(rows) < RECENT_SCAN_BATCH:
+            return kept[:limit]
+        before = (rows[-1]["eventtime"], rows[-1]["id"])
+
+def recent_etag(display_id, before, limit):
+    """ETag for one page of a recent list; call after alarm_sources.refresh()"""
+    return make_etag("alarms", display_id, before, limit, alarm_sources.max_id, alarm_version,
+                     int(time.time()) // RECENT_ETAG_SECONDS)
+
+def page_payload(rows, limit):
+    """(alarms, cursor of the next older page or None)"""
+    alarms = [
         {
             "id": row["id"],
             "message": clean_alarm_name(row["source"]),
@@ -105,80 +212,82 @@ def recent_all_units():
             "status": EVENTTYPE_MAP.get(row["eventtype"], "unknown"),
             "timestamp": row["eventtime"].strftime("%Y-%m-%d %H:%M:%S"),
             "timeAgo": time_ago(row["eventtime"]),
-            "unitId": extract_unit_id(row["source"])
+            "unitId": alarm_sources.unit_of(row["source"])
         }
         for row in rows
-    ])
+    ]
+    next_before = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_before = f"{last['eventtime'].isoformat()},{last['id']}"
+    return alarms, next_before
+
+def _recent(display_id=None):
+    try:
+        before, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The first, full scan of alarm sources runs in the background
+    if not alarm_sources.ready():
+        return jsonify({"error": "Alarm sources are still loading"}), 503
+    alarm_sources.refresh()
+    etag = recent_etag(display_id, before, limit)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    selected = recent_filter(display_id)
+    rows = []
+    if selected is not None:
+        conn = get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            scan = page_scan(*selected, before, limit)
+            try:
+                query = next(scan)
+                while True:
+                    cursor.execute(*query)
+                    query = scan.send(cursor.fetchall())
+            except StopIteration as done:
+                rows = done.value
+            cursor.close()
+        finally:
+            conn.close()
+
+    alarms, next_before = page_payload(rows, limit)
+    response = tag(jsonify(alarms), etag)
+    if next_before:
+        response.headers["X-Next-Before"] = next_before
+    return response
+
+@alarms_bp.route("/recent", methods=['GET'])
+def recent_all_units():
+    return _recent()
 
 @alarms_bp.route("/recent/<int:display_id>", methods=['GET'])
 def recent_for_unit(display_id):
-    # Convert display ID to DB tagid
-    db_tagid = get_db_tagid(display_id)
-    
-    print(f"DEBUG: Display ID {display_id} mapped to DB tagid {db_tagid}")
-    
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    # Try multiple patterns to find Unit 2 alarms
-    query = """
-        SELECT id, source, priority, eventtime, eventtype
-        FROM ignitiondb.alarm_events
-        WHERE (source LIKE %s OR source LIKE %s OR source LIKE %s)
-          AND source NOT LIKE %s
-        ORDER BY eventtime DESC
-        LIMIT 10
-    """
-    
-    # Search for Unit 2 alarms using multiple patterns
-    search_patterns = [
-        f"%MoorUnit{db_tagid}/%",  # MoorUnit3/
-        f"%U2%",                    # U2 in source
-        f"%Ux%"                     # Ux in source (might be Unit 2)
-    ]
-    
-    cursor.execute(query, (*search_patterns, "%Ramp/Ramp3:/alm:High Alarm%"))
-    rows = cursor.fetchall()
-    
-    print(f"DEBUG: Found {len(rows)} alarms for Unit {display_id} (DB tagid {db_tagid})")
-    for row in rows:
-        print(f"DEBUG: Alarm source: {row['source']}")
-    
-    conn.close()
-
-    return jsonify([
-        {
-            "id": row["id"],
-            "message": clean_alarm_name(row["source"]),
-            "priority": PRIORITY_MAP.get(row["priority"], "unknown"),
-            "status": EVENTTYPE_MAP.get(row["eventtype"], "unknown"),
-            "timestamp": row["eventtime"].strftime("%Y-%m-%d %H:%M:%S"),
-            "timeAgo": time_ago(row["eventtime"]),
-            "unitId": display_id  # Return the display ID, not the DB tagid
-        }
-        for row in rows
-    ])
+    return _recent(display_id)
 
 @alarms_bp.route("/<int:alarm_id>/acknowledge", methods=['POST'])
 def acknowledge_alarm(alarm_id):
     """Acknowledge an alarm"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Update alarm event type to acknowledged (2)
-        cursor.execute("""
-            UPDATE ignitiondb.alarm_events 
-            SET eventtype = 2 
-            WHERE id = %s
-        """, (alarm_id,))
-        
-        if cursor.rowcount == 0:
-            conn.close()
-            return jsonify({"error": "Alarm not found"}), 404
-        
-        conn.commit()
-        conn.close()
+        # The connection goes back to the pool even if the update fails
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Update alarm event type to acknowledged (2)
+            cursor.execute("""
+                UPDATE ignitiondb.alarm_events 
+                SET eventtype = 2 
+                WHERE id = %s
+            """, (alarm_id,))
+
+            if cursor.rowcount == 0:
+                return jsonify({"error": "Alarm not found"}), 404
+
+            conn.commit()
+        mark_changed()
         
         return jsonify({"success": True, "message": "Alarm acknowledged"})
         
@@ -190,25 +299,106 @@ def acknowledge_alarm(alarm_id):
 def clear_alarm(alarm_id):
     """Clear an alarm"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Update alarm event type to cleared (1)
-        cursor.execute("""
-            UPDATE ignitiondb.alarm_events 
-            SET eventtype = 1 
-            WHERE id = %s
-        """, (alarm_id,))
-        
-        if cursor.rowcount == 0:
-            conn.close()
-            return jsonify({"error": "Alarm not found"}), 404
-        
-        conn.commit()
-        conn.close()
+        # The connection goes back to the pool even if the update fails
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Update alarm event type to cleared (1)
+            cursor.execute("""
+                UPDATE ignitiondb.alarm_events 
+                SET eventtype = 1 
+                WHERE id = %s
+            """, (alarm_id,))
+
+            if cursor.rowcount == 0:
+                return jsonify({"error": "Alarm not found"}), 404
+
+            conn.commit()
+        mark_changed()
         
         return jsonify({"success": True, "message": "Alarm cleared"})
         
     except Exception as e:
         print(f"Error clearing alarm: {e}")
         return jsonify({"error": "Failed to clear alarm"}), 500
+
+def parse_batch(body):
+    """(eventtype, unique ids) from a batch request body; raises ValueError on bad input"""
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a JSON object")
+    eventtype = BATCH_ACTIONS.get(body.get("action"))
+    if eventtype is None:
+        raise ValueError(f"action must be one of {sorted(BATCH_ACTIONS)}")
+    raw_ids = body.get("ids")
+    # A string would be iterated digit by digit, a bool taken as 0 / 1, 1.5 truncated to 1
+    if not isinstance(raw_ids, list) or any(isinstance(alarm_id, bool)
+                                            or (isinstance(alarm_id, float) and not alarm_id.is_integer())
+                                            for alarm_id in raw_ids):
+        raise ValueError("ids must be a list of integers")
+    try:
+        ids = list(dict.fromkeys(int(alarm_id) for alarm_id in raw_ids))
+    except (TypeError, ValueError):
+        raise ValueError("ids must be a list of integers")
+    if not ids:
+        raise ValueError("No alarm ids given")
+    return eventtype, ids
+
+def batch_statements(eventtype, ids):
+    """Per chunk of ids: (locking SELECT, UPDATE), each as (sql, params)"""
+    for i in range(0, len(ids), BATCH_CHUNK):
+        chunk = ids[i:i + BATCH_CHUNK]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        yield (f"""
+            SELECT id FROM ignitiondb.alarm_events
+            WHERE id IN ({placeholders})
+            FOR UPDATE
+        """, chunk), (f"""
+            UPDATE ignitiondb.alarm_events
+            SET eventtype = %s
+            WHERE id IN ({placeholders})
+        """, (eventtype, *chunk))
+
+def batch_payload(eventtype, ids, found):
+    return {
+        "success": True,
+        "status": EVENTTYPE_MAP[eventtype],
+        "updated": len(found),
+        "not_found": len(ids) - len(found),
+        "results": [{"id": alarm_id, "status": "updated" if alarm_id in found else "not_found"}
+                    for alarm_id in ids]
+    }
+
+@alarms_bp.route("/batch", methods=['POST'])
+def batch_update_alarms():
+    """Acknowledge or clear many alarms in one transaction"""
+    # Body: {"ids": [...], "action": "acknowledge" | "clear"}
+    try:
+        eventtype, ids = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        conn = get_connection()
+        try:
+            conn.start_transaction()
+            cursor = conn.cursor()
+            found = set()
+            for select, update in batch_statements(eventtype, ids):
+                # rowcount skips rows already in the target state, so look the ids up first
+                cursor.execute(*select)
+                found.update(row[0] for row in cursor.fetchall())
+                cursor.execute(*update)
+            conn.commit()
+            cursor.close()
+            mark_changed()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return jsonify(batch_payload(eventtype, ids, found))
+
+    except Exception as e:
+        print(f"Error updating alarms: {e}")
+        return jsonify({"error": "Failed to update alarms"}), 500
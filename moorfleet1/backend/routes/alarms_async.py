@@ -0,0 +1,118 @@
+# routes/alarms_async.py
+import asyncio
+
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from utils import async_db
+from utils.http_cache import etag_headers, etag_matches
+from routes.alarms import (alarm_sources, parse_page_args, recent_filter, recent_etag, page_scan, page_payload,
+                           parse_batch, batch_statements, batch_payload, mark_changed)
+
+# Async handlers for /api/alarms (ASGI mode), sharing SQL and payloads with routes/alarms.py
+
+
+async def _recent(request, display_id=None):
+    try:
+        before, limit = parse_page_args(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    loop = asyncio.get_running_loop()
+    # The first, full scan of alarm sources runs in the background
+    if not await loop.run_in_executor(None, alarm_sources.ready):
+        return JSONResponse({"error": "Alarm sources are still loading"}, status_code=503)
+    # Usually a no-op; at most one short query per refresh interval
+    await loop.run_in_executor(None, alarm_sources.refresh)
+    etag = recent_etag(display_id, before, limit)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+    selected = recent_filter(display_id)
+    rows = []
+    if selected:
+        scan = page_scan(*selected, before, limit)
+        try:
+            query = next(scan)
+            while True:
+                query = scan.send(await async_db.fetch_all(*query))
+        except StopIteration as done:
+            rows = done.value
+
+    alarms, next_before = page_payload(rows, limit)
+    headers = etag_headers(etag)
+    if next_before:
+        headers["X-Next-Before"] = next_before
+    return JSONResponse(alarms, headers=headers)
+
+
+async def recent_all_units(request):
+    return await _recent(request)
+
+
+async def recent_for_unit(request):
+    return await _recent(request, request.path_params["display_id"])
+
+
+async def _set_eventtype(alarm_id, eventtype, done, failed):
+    try:
+        updated = await async_db.execute("""
+            UPDATE ignitiondb.alarm_events
+            SET eventtype = %s
+            WHERE id = %s
+        """, (eventtype, alarm_id))
+    except Exception as e:
+        print(f"Error updating alarm: {e}")
+        return JSONResponse({"error": failed}, status_code=500)
+    if updated == 0:
+        return JSONResponse({"error": "Alarm not found"}, status_code=404)
+    mark_changed()
+    return JSONResponse({"success": True, "message": done})
+
+
+async def acknowledge_alarm(request):
+    return await _set_eventtype(request.path_params["alarm_id"], 2, "Alarm acknowledged",
+                                "Failed to acknowledge alarm")
+
+
+async def clear_alarm(request):
+    return await _set_eventtype(request.path_params["alarm_id"], 1, "Alarm cleared", "Failed to clear alarm")
+
+
+async def batch_update_alarms(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    try:
+        eventtype, ids = parse_batch(body)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        found = set()
+        async with async_db.pool().acquire() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor() as cursor:
+                    for select, update in batch_statements(eventtype, ids):
+                        await cursor.execute(*select)
+                        found.update(row[0] for row in await cursor.fetchall())
+                        await cursor.execute(*update)
+                await conn.commit()
+                mark_changed()
+            except BaseException:
+                await conn.rollback()
+                raise
+        return JSONResponse(batch_payload(eventtype, ids, found))
+    except Exception as e:
+        print(f"Error updating alarms: {e}")
+        return JSONResponse({"error": "Failed to update alarms"}, status_code=500)
+
+
+routes = [
+    Route("/api/alarms/recent", recent_all_units, methods=["GET"]),
+    Route("/api/alarms/recent/{display_id:int}", recent_for_unit, methods=["GET"]),
+    Route("/api/alarms/batch", batch_update_alarms, methods=["POST"]),
+    Route("/api/alarms/{alarm_id:int}/acknowledge", acknowledge_alarm, methods=["POST"]),
+    Route("/api/alarms/{alarm_id:int}/clear", clear_alarm, methods=["POST"]),
+]
@@ -1,20 +1,52 @@
 # routes/kpi.py
-from flask import Blueprint, jsonify, request
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from flask import Blueprint, current_app, jsonify, request
 from kpi_calculations.kpi_availability import calculate_AVAILABILITY_KPI as availability_kpi
 from kpi_calculations.kpi_mtbf import calculate_MTBF_KPI as mtbf_kpi
 from kpi_calculations.kpi_utilization import calculate_UTIL_KPI as utilization_kpi
+from kpi_calculations.kpi_data import load_snapshot
+from kpi_calculations.kpi_history import (calculate_KPI_HISTORY_COLUMNS as kpi_history_columns, history_rows,
+                                          HISTORY_STEP)
+from kpi_calculations.kpi_cache import kpi_cache, bucket_end
+from kpi_calculations.kpi_common import DUR_MAP, DUR_TO_DELTA
+from kpi_calculations.kpi_precompute import KPIPrecompute, latest_row
+from kpi_calculations.kpi_rollup import KPIRollup, HOUR, window_kpis
 from routes.units import get_all_unit_ids  # for all-units route
-from datetime import datetime, timedelta, timezone
+from utils import timing
+from utils.http_cache import make_etag, not_modified, tag
+from utils.series import parse_format, series_response
+from utils.single_flight import SingleFlight
 
 kpi_bp = Blueprint("kpis", __name__)
 
 # Duration normalization map
-dur_map = {
-    "24h": "1D", "1D": "1D",
-    "7d": "7D", "7D": "7D",
-    "30d": "30D", "30D": "30D",
-    "12M": "1Y", "1Y": "1Y"
-}
+dur_map = DUR_MAP
+
+# Fleet endpoint: bounded worker pool and per-request deadline (seconds)
+FLEET_WORKERS = int(os.environ.get("MOORFLEET_FLEET_WORKERS", "8"))
+FLEET_DEADLINE = float(os.environ.get("MOORFLEET_FLEET_DEADLINE", "30"))
+_fleet_executor = ThreadPoolExecutor(max_workers=FLEET_WORKERS, thread_name_prefix="fleet-kpi")
+
+# Fleet unit computations still running, per (duration, unit): a request whose deadline
+# passes leaves its work running, and later requests join it instead of queueing more
+_fleet_pending = {}
+_fleet_pending_lock = threading.Lock()
+
+# Window snapshot loads under way, shared by concurrent requests
+_snapshot_loads = SingleFlight()
+
+# Background writer of the KPI history table, started on the first KPI request
+kpi_precompute = KPIPrecompute(get_all_unit_ids())
+# Background maintainer of the hourly / daily rollups behind arbitrary windows
+kpi_rollup = KPIRollup(get_all_unit_ids())
+
+# Window endpoint: most buckets one request may ask for
+MAX_WINDOW_BUCKETS = int(os.environ.get("MOORFLEET_MAX_WINDOW_BUCKETS", "10000"))
 
 # helper to normalize unit IDs
 def normalize_unit_id(unit_id: str) -> str:
@@ -23,29 +55,170 @@ def normalize_unit_id(unit_id: str) -> str:
         return f"U{unit_id}"
     return unit_id
 
+def _check_duration(dur):
+    if dur not in DUR_TO_DELTA:
+        raise ValueError(f"Invalid duration: {dur}")
+
+def _parse_time(value):
+    """Epoch seconds from epoch seconds or an ISO 8601 string (naive means UTC); raises ValueError."""
+    try:
+        seconds = float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+    if not math.isfinite(seconds):
+        raise ValueError("times must be finite")
+    return int(seconds)
+
+def _parse_bucket(value):
+    """Bucket length in seconds from '<n>h', '<n>d' or seconds; whole hours only."""
+    if value is None:
+        return None
+    units = {"h": 3600, "d": 86400}
+    seconds = int(value[:-1]) * units[value[-1]] if value[-1:] in units else int(value)
+    if seconds <= 0 or seconds % HOUR:
+        raise ValueError("bucket must be a positive whole number of hours")
+    return seconds
+
+def _lazy_snapshot(dur):
+    """Load the window snapshot on first use only, so cache hits never query the database.
+
+    Requests needing the same window at the same time share one load.
+    """
+    loaded = {}
+    lock = threading.Lock()
+    def get(end_time):
+        with lock:
+            if end_time not in loaded:
+                loaded[end_time] = _snapshot_loads.do((dur, end_time), lambda: load_snapshot(dur, end_time))
+            return loaded[end_time]
+    return get
+
+def _etag(kind, dur, *parts):
+    """ETag of a KPI response: its window end bucket and the KPI cache's data watermark.
+
+    Checked before any computation; a precomputed row that lags by a bucket
+    (PRECOMPUTE_MAX_LAG) may keep being revalidated until the bucket moves.
+    """
+    return make_etag("kpis", kind, dur, *parts, int(bucket_end(dur).timestamp()), kpi_cache.watermark())
+
+def _precomputed(dur, unit, end_time=None):
+    """Latest precomputed KPIs for one unit, or None if missing or stale.
+
+    Looked up once per window bucket through the KPI cache (misses and lookup
+    failures included), so cache hits do not query the database.
+    """
+    kpi_precompute.start()
+    def lookup(d, end):
+        try:
+            return latest_row(unit, d, now=end)
+        except Exception as e:
+            current_app.logger.warning("KPI history lookup failed: %s", e)
+            return None
+    return kpi_cache.get_or_compute("precomputed", unit, dur, lookup, end_time)
+
+def _parse_timeout(value):
+    """Fleet deadline in seconds from ?timeout=, capped at FLEET_DEADLINE; raises ValueError."""
+    if value is None:
+        return FLEET_DEADLINE
+    deadline = float(value)
+    if not math.isfinite(deadline) or deadline <= 0:
+        raise ValueError("timeout must be a positive number of seconds")
+    return min(deadline, FLEET_DEADLINE)
+
+def _fleet_future(dur, unit, snapshot, end_time):
+    """Future of one unit's KPIs for the window ending at end_time (a bucket end).
+
+    The one already running for (dur, unit, end bucket) is reused; a window
+    that has moved to a new bucket gets a new submission.
+    """
+    key = (dur, unit, int(end_time.timestamp()))
+    with _fleet_pending_lock:
+        future = _fleet_pending.get(key)
+        if future is not None:
+            return future
+        future = _fleet_pending[key] = _fleet_executor.submit(
+            timing.bind(_unit_kpis), dur, unit, snapshot, end_time)
+    # Outside the lock: the callback runs right away if the future is already done
+    future.add_done_callback(lambda _: _forget_fleet_future(key, future))
+    return future
+
+def _forget_fleet_future(key, future):
+    with _fleet_pending_lock:
+        if _fleet_pending.get(key) is future:
+            del _fleet_pending[key]
+
+def _unit_kpis(dur, unit, snapshot, end_time=None):
+    """Availability, MTBF and utilization for one unit, over the window ending at end_time (default now).
+
+    Served from the KPI history table when a recent row exists, else computed
+    on demand (through the KPI cache).
+    """
+    row = _precomputed(dur, unit, end_time)
+    if row is not None:
+        return row
+    availability = kpi_cache.get_or_compute(
+        "availability", unit, dur, lambda d, end: availability_kpi(d, unit, end_time=end), end_time)
+    mtbf_value, mtbf_params = kpi_cache.get_or_compute(
+        "mtbf", unit, dur, lambda d, end: mtbf_kpi(d, unit, snapshot=snapshot(end)), end_time)
+    utilization = kpi_cache.get_or_compute(
+        "utilization", unit, dur, lambda d, end: utilization_kpi(d, unit, snapshot=snapshot(end)), end_time)
+    return {
+        "unit": unit,
+        "duration": dur,
+        "availability": availability,
+        "mtbf": mtbf_value,
+        "mtbf_details": mtbf_params,
+        "utilization": utilization
+    }
+
 @kpi_bp.route("/", methods=["GET"])
 def get_all_kpis():
-    """Return KPI data for all units when ?range=<duration> is provided."""
+    """Return KPI data for all units when ?range=<duration> is provided.
+
+    Units are computed concurrently; optional ?timeout=<seconds> shortens the
+    deadline. Each entry carries status ok / error / timeout so one slow or
+    failing unit does not fail the whole fleet.
+    """
     try:
         duration = request.args.get("range", "30D")
         dur = dur_map.get(duration, duration)
+        _check_duration(dur)
+        try:
+            deadline = _parse_timeout(request.args.get("timeout"))
+        except ValueError:
+            return jsonify({"error": f"Invalid timeout: {request.args.get('timeout')}"}), 400
+        etag = _etag("fleet", dur)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        # At most one window fetch, shared by every unit and every KPI
+        snapshot = _lazy_snapshot(dur)
+
+        units = [normalize_unit_id(str(unit)) for unit in get_all_unit_ids()]
+        # Running work cannot be cancelled: at most one task per (duration, unit, end bucket) is
+        # outstanding, however many requests time out, and late results still land in the KPI cache
+        end_time = bucket_end(dur)
+        futures = {unit: _fleet_future(dur, unit, snapshot, end_time) for unit in units}
+        done, _ = wait(futures.values(), timeout=deadline)
 
         all_units = []
-        for unit in get_all_unit_ids():
-            norm_unit = normalize_unit_id(str(unit))
-            availability = availability_kpi(dur, norm_unit)
-            mtbf_value, mtbf_params = mtbf_kpi(dur, norm_unit)
-            utilization = utilization_kpi(dur, norm_unit)
-            all_units.append({
-                "unit": norm_unit,
-                "duration": dur,
-                "availability": availability,
-                "mtbf": mtbf_value,
-                "mtbf_details": mtbf_params,
-                "utilization": utilization
-            })
-
-        return jsonify(all_units)
+        for unit, future in futures.items():
+            if future not in done:
+                all_units.append({"unit": unit, "duration": dur, "status": "timeout",
+                                  "error": f"No result within {deadline:g}s"})
+            elif future.exception() is not None:
+                all_units.append({"unit": unit, "duration": dur, "status": "error",
+                                  "error": str(future.exception())})
+            else:
+                all_units.append({**future.result(), "status": "ok"})
+
+        # Partial results are never revalidated
+        complete = all(entry["status"] == "ok" for entry in all_units)
+        return tag(jsonify(all_units), etag if complete else None)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -56,18 +229,13 @@ def get_kpis(unit_id, duration):
     try:
         dur = dur_map.get(duration, duration)
         norm_unit = normalize_unit_id(unit_id)
-        availability = availability_kpi(dur, norm_unit)
-        mtbf_value, mtbf_params = mtbf_kpi(dur, norm_unit)
-        utilization = utilization_kpi(dur, norm_unit)
+        _check_duration(dur)
+        etag = _etag("unit", dur, norm_unit)
+        cached = not_modified(etag)
+        if cached:
+            return cached
 
-        return jsonify({
-            "unit": norm_unit,
-            "duration": dur,
-            "availability": availability,
-            "mtbf": mtbf_value,
-            "mtbf_details": mtbf_params,
-            "utilization": utilization
-        })
+        return tag(jsonify(_unit_kpis(dur, norm_unit, _lazy_snapshot(dur))), etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -76,49 +244,79 @@ def get_kpis(unit_id, duration):
 def get_kpi_history(unit_id):
     """
     Return historical KPI data for charts.
-    Optional query param: range=1D|7D|30D|1Y (default 30D)
-    Output: [{timestamp, uptime, utilization, mtbf}, ...]
+    Optional query params: range=1D|7D|30D|1Y (default 30D),
+    format=rows|columns|msgpack|arrow (default rows)
+    Output (rows): [{timestamp, uptime, utilization, mtbf}, ...]
+    Other formats: {timestamp: [epoch ms, ...], uptime: [...], mtbf: [...], utilization: [...]}
     """
     try:
         duration = request.args.get("range", "30D")
         dur = dur_map.get(duration, duration)
         norm_unit = normalize_unit_id(unit_id)
 
-        # Define start date based on range
-        now = datetime.now(timezone.utc)
-        if dur == "1D":
-            start_time = now - timedelta(days=1)
-            step = timedelta(hours=1)  # hourly points
-        elif dur == "7D":
-            start_time = now - timedelta(days=7)
-            step = timedelta(days=1)   # daily points
-        elif dur == "30D":
-            start_time = now - timedelta(days=30)
-            step = timedelta(days=1)
-        elif dur == "1Y":
-            start_time = now - timedelta(days=365)
-            step = timedelta(days=30)  # monthly-ish
-        else:
+        if dur not in HISTORY_STEP:
             return jsonify({"error": f"Invalid range: {duration}"}), 400
+        try:
+            fmt = parse_format(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        etag = _etag("history", dur, norm_unit)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+        # One fetch for the covering range, every point computed in a single sweep
+        columns = kpi_cache.get_or_compute(
+            "history", norm_unit, dur, lambda d, end: kpi_history_columns(d, norm_unit, end_time=end))
 
-        # Build time series
-        history = []
-        current_time = start_time
-        while current_time <= now:
-            # For each time slice, run KPI calculations
-            avail = availability_kpi(dur, norm_unit, end_time=current_time)
-            mtbf_val, _ = mtbf_kpi(dur, norm_unit, end_time=current_time)
-            util = utilization_kpi(dur, norm_unit, end_time=current_time)
-
-            history.append({
-                "timestamp": current_time.isoformat(),
-                "uptime": avail,
-                "mtbf": mtbf_val,
-                "utilization": util
-            })
-            current_time += step
-
-        return jsonify(history)
+        if fmt == "rows":
+            return tag(jsonify(history_rows(columns)), etag)
+        return tag(series_response(columns, fmt), etag)
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+@kpi_bp.route("/<unit_id>/window", methods=["GET"])
+def get_kpi_window(unit_id):
+    """
+    Return KPIs over an arbitrary window, optionally split into buckets.
+    Query params: start (required), end (default now), as epoch seconds or ISO 8601;
+    bucket=<n>h|<n>d (optional, aligned to UTC multiples of the bucket length)
+    Output: {unit, start, end, bucket, buckets: [{start, end, availability, utilization,
+    mtbf, failures, maintenance_events, remote_seconds, maintenance_seconds, states}, ...]}
+    """
+    try:
+        norm_unit = normalize_unit_id(unit_id)
+        try:
+            if "start" not in request.args:
+                raise ValueError("start is required")
+            now = int(time.time())
+            start = _parse_time(request.args["start"])
+            end = min(_parse_time(request.args["end"]) if "end" in request.args else now, now)
+            bucket = _parse_bucket(request.args.get("bucket"))
+            if start >= end:
+                raise ValueError("start must be before end")
+            if bucket is not None and (end - start) // bucket > MAX_WINDOW_BUCKETS:
+                raise ValueError(f"At most {MAX_WINDOW_BUCKETS} buckets per request")
+        except (KeyError, ValueError, OverflowError) as e:
+            return jsonify({"error": f"Invalid window: {e}"}), 400
+        if norm_unit not in kpi_rollup.units:
+            return jsonify({"error": f"Unknown unit: {unit_id}"}), 400
+
+        kpi_rollup.start()
+        return jsonify({
+            "unit": norm_unit,
+            "start": start,
+            "end": end,
+            "bucket": bucket,
+            "buckets": window_kpis(norm_unit, start, end, bucket)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@kpi_bp.route("/cache", methods=["GET"])
+def get_kpi_cache_stats():
+    """Return KPI cache hit/miss counters (for sizing the cache)."""
+    return jsonify(kpi_cache.stats())
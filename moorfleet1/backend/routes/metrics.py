@@ -0,0 +1,12 @@
+# routes/metrics.py
+from flask import Blueprint, Response
+
+from utils import metrics
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("", methods=["GET"])
+def get_metrics():
+    """Request latency, per-phase time and rows fetched as Prometheus histograms."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -1,6 +1,14 @@
-from flask import Blueprint, jsonify
-from mysql.connector import connect
+import json
+import queue
+import numpy as np
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from datetime import timedelta
+from utils import historian
+from utils.http_cache import make_etag, not_modified, tag
+from utils.series import parse_format, series_response
 from utils.mooring_states import MOORING_STATES
+from utils.state_feed import StateFeed, heartbeat
+from utils.state_store import StateStore
 
 # Define blueprint
 units_bp = Blueprint('units', __name__)
@@ -14,15 +22,6 @@ def get_all_unit_ids():
     return [f"U{display_id}" for display_id in UNIT_ID_MAPPING.keys()]
 
 
-# DB connection to ignitiondb
-def get_ignition_connection():
-    return connect(
-        host="127.0.0.1",
-        user="root",
-        password="U8NbpiQxGyemHJrB",
-        database="ignitiondb"
-    )
-
 # Unit ID mapping: Display ID → DB tagid
 UNIT_ID_MAPPING = {
     1: 1,  # Unit 1 → tagid 1
@@ -33,121 +32,224 @@ def get_db_tagid(display_id):
     """Convert display unit ID to database tagid"""
     return UNIT_ID_MAPPING.get(display_id, display_id)
 
-# Route to get latest states of Unit 1 and 2
-@units_bp.route('/', methods=['GET'])
-def get_unit_statuses():
-    conn = get_ignition_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    query = """
-        SELECT tagid, intvalue, t_stamp
-        FROM sqlt_data_1_2025_08
-        WHERE tagid IN (1, 3)
-        ORDER BY t_stamp DESC
-    """
+# Latest-state index per unit, kept current by incremental historian reads;
+# also the single tailer shared by every /stream subscriber
+state_feed = StateFeed({db_tagid: display_id for display_id, db_tagid in UNIT_ID_MAPPING.items()})
+
+# On-disk state transitions per unit tag, appended to in the background
+state_store = StateStore(UNIT_ID_MAPPING.values())
 
-    cursor.execute(query)
-    rows = cursor.fetchall()
-
-    latest = {}
-    for row in rows:
-        tagid = row["tagid"]
-        # Map DB tagid back to display ID
-        display_id = 1 if tagid == 1 else 2 if tagid == 3 else tagid
-        
-        if tagid not in latest:
-            latest[tagid] = {
-                "tagid": tagid,
-                "unit": f"Unit {display_id}",
-                "state_code": row["intvalue"],
-                "state": MOORING_STATES.get(row["intvalue"], "Unknown"),
-                "last_updated": row["t_stamp"],
-                "location": "Global Terminal 1",
-                "serial_number": f"SN-{10000 + tagid}",
-                "asset_type": "MM2",
-                "installation_year": 2020,
-                "sla_active": True,
-                "commissioned_year": 2021,
-                "site_name": "Global Terminal 1",
-                "end_user": "Maritime Solutions Inc.",
-                "country": "India"
+# Seconds between SSE keep-alive comments on a quiet stream
+STREAM_KEEPALIVE = 15
+
+def unit_payload(tagid, unit, state_code, last_updated, asset_type):
+    return {
+        "tagid": tagid,
+        "unit": unit,
+        "state_code": state_code,
+        "state": MOORING_STATES.get(state_code, "Unknown"),
+        "last_updated": last_updated,
+        "location": "Global Terminal 1",
+        "serial_number": f"SN-{10000 + tagid}",
+        "asset_type": asset_type,
+        "installation_year": 2020,
+        "sla_active": True,
+        "commissioned_year": 2021,
+        "site_name": "Global Terminal 1",
+        "end_user": "Maritime Solutions Inc.",
+        "country": "India"
+    }
+
+def event_key(event):
+    # last_updated moves on every row; clients revalidate once per heartbeat period instead
+    return (event["tagid"], event["state_code"], heartbeat(event["last_updated"]))
+
+def statuses_etag(events):
+    """Changes when some unit's state does or a heartbeat passes, not on every historian row"""
+    return make_etag("units", sorted(event_key(event) for event in events))
+
+def history_etag(db_tagid, columns):
+    # The log is append-only: the newest transition, its duration so far and the row count identify the page
+    ts, durations = columns["timestamp"], columns["duration"]
+    return make_etag("history", db_tagid, len(ts), int(ts[0]) if len(ts) else None,
+                     int(durations[0]) if len(ts) else None)
+
+def history_start_ms():
+    """Start of the state history window: the last 7 days"""
+    return historian.now_ms() - int(timedelta(days=7).total_seconds() * 1000)
+
+def store_history(db_tagid, start_ms, limit=100):
+    """Newest-first state changes from the transition store, or None until it has caught up"""
+    state_store.start()
+    if not state_store.ready(db_tagid):
+        return None
+    ts, states = state_store.transitions(db_tagid, start_ms)
+    # Each state lasts until the next change; the current one up to the store's watermark
+    durations = np.diff(ts, append=max(state_store.watermark(db_tagid), ts[-1])) if len(ts) else ts
+    keep = ts >= start_ms
+    return history_columns(ts[keep][::-1][:limit], states[keep][::-1][:limit], durations[keep][::-1][:limit])
+
+def history_columns(timestamps, state_codes, durations):
+    return {
+        "timestamp": timestamps,
+        "state_code": state_codes,
+        "duration": durations  # ms
+    }
+
+def historian_history(rows):
+    """Columns for newest-first raw rows; each row lasts until the next newer one (the newest until now)"""
+    ts = np.array([row["t_stamp"] for row in rows], dtype=np.int64)
+    durations = np.diff(ts[::-1], append=historian.now_ms())[::-1] if len(ts) else ts
+    return history_columns(ts, [row["intvalue"] for row in rows], durations)
+
+def parse_window(args):
+    """(start, end) epoch ms from ?start=&end=, defaulting to the history window; raises ValueError"""
+    end = int(args.get("end", historian.now_ms()))
+    start = int(args.get("start", end - int(timedelta(days=7).total_seconds() * 1000)))
+    if start >= end:
+        raise ValueError("start must be before end")
+    return start, end
+
+def dwell_payload(display_id, start, end):
+    """Time per mooring state over [start, end), or None until the store has caught up"""
+    db_tagid = get_db_tagid(display_id)
+    if db_tagid not in state_store.logs:
+        raise KeyError(display_id)
+    state_store.start()
+    if not state_store.ready(db_tagid):
+        return None
+    # Nothing is known past the store's watermark
+    end = min(end, max(state_store.watermark(db_tagid), start))
+    spent = state_store.runs(db_tagid).dwell(start, end)
+    window = end - start
+    return {
+        "unit": f"Unit {display_id}",
+        "tagid": db_tagid,
+        "start": start,
+        "end": end,
+        "states": [
+            {
+                "state_code": state,
+                "state": MOORING_STATES.get(state, "Unknown"),
+                "duration": duration,
+                "percent": round(duration / window * 100, 2) if window else 0
             }
+            for state, duration in spent.items()
+        ],
+        "unknown": window - sum(spent.values())  # before the first recorded state
+    }
 
-    conn.close()
-    return jsonify(list(latest.values()))
+# Route to get latest states of Unit 1 and 2
+@units_bp.route('/', methods=['GET'])
+def get_unit_statuses():
+    # Served from the in-memory index: only rows past the last seen t_stamp are read
+    state_feed.refresh()
+    events = state_feed.current()
+    etag = statuses_etag(events)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    latest = sorted(events, key=lambda event: event["last_updated"], reverse=True)
+
+    return tag(jsonify([unit_payload(event["tagid"], event["unit"], event["state_code"], event["last_updated"], "MM2")
+                        for event in latest]), etag)
 
 # Route to get individual unit data
 @units_bp.route('/<int:display_id>', methods=['GET'])
 def get_unit_status(display_id):
     # Convert display ID to DB tagid
     db_tagid = get_db_tagid(display_id)
-    
-    conn = get_ignition_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    query = """
-        SELECT tagid, intvalue, t_stamp
-        FROM sqlt_data_1_2025_08
-        WHERE tagid = %s
-        ORDER BY t_stamp DESC
-        LIMIT 1
-    """
-
-    cursor.execute(query, (db_tagid,))
-    row = cursor.fetchone()
+    etag = None
+
+    if db_tagid in state_feed.tag_units:
+        state_feed.refresh()
+        event = state_feed.latest(db_tagid)
+        if event:
+            etag = make_etag("unit", display_id, event_key(event))
+            cached = not_modified(etag)
+            if cached:
+                return cached
+        row = event and {"tagid": event["tagid"], "intvalue": event["state_code"], "t_stamp": event["last_updated"]}
+    else:
+        # Tags outside the index: newest partition first
+        row = historian.latest_rows([db_tagid]).get(db_tagid)
 
     if not row:
-        conn.close()
         return jsonify({"error": "Unit not found"}), 404
 
-    unit_data = {
-        "tagid": row["tagid"],
-        "unit": f"Unit {display_id}",
-        "state_code": row["intvalue"],
-        "state": MOORING_STATES.get(row["intvalue"], "Unknown"),
-        "last_updated": row["t_stamp"],
-        "location": "Global Terminal 1",
-        "serial_number": f"SN-{10000 + db_tagid}",
-        "asset_type": "MM1",
-        "installation_year": 2020,
-        "sla_active": True,
-        "commissioned_year": 2021,
-        "site_name": "Global Terminal 1",
-        "end_user": "Maritime Solutions Inc.",
-        "country": "India"
-    }
+    unit_data = unit_payload(row["tagid"], f"Unit {display_id}", row["intvalue"], row["t_stamp"], "MM1")
 
-    conn.close()
-    return jsonify(unit_data)
+    return tag(jsonify(unit_data), etag)
 
 # Route to get unit state history
 @units_bp.route('/<int:display_id>/history', methods=['GET'])
 def get_unit_history(display_id):
+    # ?format=rows|columns|msgpack|arrow (default rows)
+    try:
+        fmt = parse_format(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Convert display ID to DB tagid
     db_tagid = get_db_tagid(display_id)
     
-    conn = get_ignition_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    query = """
-        SELECT t_stamp, intvalue
-        FROM sqlt_data_1_2025_08
-        WHERE tagid = %s
-        AND t_stamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-        ORDER BY t_stamp DESC
-        LIMIT 100
-    """
-
-    cursor.execute(query, (db_tagid,))
-    rows = cursor.fetchall()
-
-    history = []
-    for row in rows:
-        history.append({
-            "timestamp": row["t_stamp"],
-            "state_code": row["intvalue"],
-            "duration": 0  # Duration calculation can be added later
-        })
-
-    conn.close()
-    return jsonify(history)
+    # Last 7 days: state changes from the transition store, else raw rows across
+    # whichever monthly partitions cover them
+    start_ms = history_start_ms()
+    columns = store_history(db_tagid, start_ms)
+    etag = None
+    if columns is None:
+        columns = historian_history(historian.read_range([db_tagid], start_ms, descending=True, limit=100))
+    else:
+        etag = history_etag(db_tagid, columns)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
+    return tag(series_response(columns, fmt), etag)
+
+
+# Route to get time spent per mooring state, ?start=&end= epoch ms (default last 7 days)
+@units_bp.route('/<int:display_id>/dwell', methods=['GET'])
+def get_unit_dwell(display_id):
+    try:
+        start, end = parse_window(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        payload = dwell_payload(display_id, start, end)
+    except KeyError:
+        return jsonify({"error": "Unit not found"}), 404
+    if payload is None:
+        return jsonify({"error": "State history is still loading"}), 503
+    return jsonify(payload)
+
+
+def sse_message(event):
+    if event.get("heartbeat"):
+        # Same state, newer last_updated
+        data = {key: value for key, value in event.items() if key != "heartbeat"}
+        return f"event: heartbeat\ndata: {json.dumps(data, default=str)}\n\n"
+    return f"event: state\ndata: {json.dumps(event, default=str)}\n\n"
+
+# Server-sent events: current state of every unit, then one message per state change
+# and a heartbeat message when only a unit's last_updated has moved
+@units_bp.route('/stream', methods=['GET'])
+def stream_unit_states():
+    def events():
+        q = state_feed.subscribe()
+        try:
+            for event in state_feed.current():
+                yield sse_message(event)
+            while True:
+                try:
+                    event = q.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_message(event)
+        finally:
+            state_feed.unsubscribe(q)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
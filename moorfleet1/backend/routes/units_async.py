@@ -0,0 +1,134 @@
+# routes/units_async.py
+import asyncio
+import queue
+
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from utils import historian, timing
+from utils.http_cache import etag_headers, etag_matches, make_etag
+from utils.series import FORMATS, encode, parse_format, to_rows
+from routes.units import (state_feed, get_db_tagid, unit_payload, history_start_ms, store_history,
+                          historian_history, parse_window, dwell_payload, sse_message, event_key, statuses_etag, history_etag,
+                          STREAM_KEEPALIVE)
+
+# Async handlers for /api/units (ASGI mode). The state feed tails the historian
+# in the background, so status reads never wait on the database.
+
+
+def _not_modified(request, etag):
+    if etag is not None and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=etag_headers(etag))
+    return None
+
+
+async def get_unit_statuses(request):
+    events = state_feed.current()
+    etag = statuses_etag(events)
+    cached = _not_modified(request, etag)
+    if cached:
+        return cached
+    latest = sorted(events, key=lambda event: event["last_updated"], reverse=True)
+    return JSONResponse([unit_payload(event["tagid"], event["unit"], event["state_code"],
+                                      event["last_updated"], "MM2")
+                         for event in latest], headers=etag_headers(etag))
+
+
+async def get_unit_status(request):
+    display_id = request.path_params["display_id"]
+    db_tagid = get_db_tagid(display_id)
+    etag = None
+
+    if db_tagid in state_feed.tag_units:
+        event = state_feed.latest(db_tagid)
+        if event:
+            etag = make_etag("unit", display_id, event_key(event))
+            cached = _not_modified(request, etag)
+            if cached:
+                return cached
+        row = event and {"tagid": event["tagid"], "intvalue": event["state_code"], "t_stamp": event["last_updated"]}
+    else:
+        # Tags outside the index: newest partition first, off the event loop
+        rows = await asyncio.get_running_loop().run_in_executor(None, historian.latest_rows, [db_tagid])
+        row = rows.get(db_tagid)
+
+    if not row:
+        return JSONResponse({"error": "Unit not found"}, status_code=404)
+    return JSONResponse(unit_payload(row["tagid"], f"Unit {display_id}", row["intvalue"], row["t_stamp"], "MM1"),
+                        headers=etag_headers(etag))
+
+
+async def get_unit_history(request):
+    try:
+        fmt = parse_format(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    db_tagid = get_db_tagid(request.path_params["display_id"])
+    start_ms = history_start_ms()
+    # Segment reads run off the event loop
+    with timing.phase("fetch"):
+        columns = await asyncio.to_thread(store_history, db_tagid, start_ms)
+    etag = None
+    if columns is None:
+        columns = historian_history(
+            await historian.read_range_async([db_tagid], start_ms, descending=True, limit=100))
+    else:
+        etag = history_etag(db_tagid, columns)
+        cached = _not_modified(request, etag)
+        if cached:
+            return cached
+    with timing.phase("serialize"):
+        if fmt == "rows":
+            return JSONResponse(to_rows(columns), headers=etag_headers(etag))
+        return Response(encode(columns, fmt), media_type=FORMATS[fmt], headers=etag_headers(etag))
+
+
+async def get_unit_dwell(request):
+    try:
+        start, end = parse_window(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    try:
+        with timing.phase("compute"):
+            payload = await asyncio.to_thread(dwell_payload, request.path_params["display_id"], start, end)
+    except KeyError:
+        return JSONResponse({"error": "Unit not found"}, status_code=404)
+    if payload is None:
+        return JSONResponse({"error": "State history is still loading"}, status_code=503)
+    return JSONResponse(payload)
+
+
+async def stream_unit_states(request):
+    async def events():
+        q = state_feed.subscribe()
+        try:
+            for event in state_feed.current():
+                yield sse_message(event)
+            idle = 0.0
+            while not await request.is_disconnected():
+                try:
+                    event = q.get_nowait()
+                except queue.Empty:
+                    # The feed publishes at most once per poll interval
+                    await asyncio.sleep(state_feed.interval)
+                    idle += state_feed.interval
+                    if idle >= STREAM_KEEPALIVE:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+                    continue
+                idle = 0.0
+                yield sse_message(event)
+        finally:
+            state_feed.unsubscribe(q)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+routes = [
+    Route("/api/units/", get_unit_statuses, methods=["GET"]),
+    Route("/api/units/stream", stream_unit_states, methods=["GET"]),
+    Route("/api/units/{display_id:int}", get_unit_status, methods=["GET"]),
+    Route("/api/units/{display_id:int}/history", get_unit_history, methods=["GET"]),
+    Route("/api/units/{display_id:int}/dwell", get_unit_dwell, methods=["GET"]),
+]
@@ -4,15 +4,20 @@ from flask_cors import CORS
 from routes.units import units_bp
 from routes.alarms import alarms_bp
 from routes.kpi import kpi_bp
+from routes.metrics import metrics_bp
+from utils import http_cache, metrics
 
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Before", "Server-Timing", "ETag"])  # alarm page cursor, phase timings
+metrics.init_app(app)  # per-request phase timings
+http_cache.init_app(app)  # gzip / brotli of large responses
 
 
 app.register_blueprint(units_bp, url_prefix='/api/units')
 app.register_blueprint(alarms_bp, url_prefix='/api/alarms')
 app.register_blueprint(kpi_bp, url_prefix="/api/kpis")  # /api/kpis/U1/1D
+app.register_blueprint(metrics_bp, url_prefix="/api/metrics")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+# tests/test_alarm_sources.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from routes import alarms
+from utils import alarm_sources as alarm_sources_module
+from utils.alarm_sources import AlarmSourceIndex
+
+T0 = datetime(2025, 8, 20, 12, 0, 0)
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, sql, args):
+        self.db.queries += 1
+        self.result = [(source, last_id) for source, last_id in self.db.sources if last_id > args[0]]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self, sources):
+        self.sources = sources
+        self.queries = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def source_db(monkeypatch):
+    db = FakeDB([("MoorUnit1/a", 1), ("MoorUnit3/b", 2), ("hidden", 3)])
+    monkeypatch.setattr(alarm_sources_module, "get_connection", lambda: db)
+    return db
+
+
+def make_index():
+    return AlarmSourceIndex(lambda source: 1 if "MoorUnit1" in source else 2, lambda source: source == "hidden")
+
+
+def test_ready_warms_in_background(source_db):
+    index = make_index()
+    assert index.ready(timeout=5)
+    assert index.sources_for(1) == ["MoorUnit1/a"]
+    assert index.excluded_sources() == ["hidden"]
+    assert index.max_id == 3
+
+
+def test_refresh_reads_only_new_events(source_db):
+    index = make_index()
+    index.refresh(0)
+    source_db.sources.append(("MoorUnit1/c", 4))
+    index.refresh(0)
+    assert index.sources_for(1) == ["MoorUnit1/a", "MoorUnit1/c"]
+    index.refresh(60)
+    assert source_db.queries == 2
+
+
+def run_scan(scan, table):
+    """Drive page_scan against rows sorted newest first; returns (page rows, queries run)."""
+    queries = 0
+    try:
+        query = next(scan)
+        while True:
+            queries += 1
+            sql, params = query
+            limit = params[-1]
+            before = params[-4:-1] if "eventtime <" in sql else None
+            rows = [row for row in table
+                    if before is None or (row["eventtime"], row["id"]) < (before[0], before[2])]
+            query = scan.send(rows[:limit])
+    except StopIteration as done:
+        return done.value, queries
+
+
+@pytest.fixture
+def many_sources(monkeypatch):
+    monkeypatch.setattr(alarms, "RECENT_IN_MAX", 3)
+    monkeypatch.setattr(alarms, "RECENT_SCAN_BATCH", 4)
+    index = AlarmSourceIndex(lambda source: int(source[1]), lambda source: source.startswith("x"))
+    index.units = {f"u{unit}-{i}": unit for unit in (1, 2) for i in range(5)}
+    index.by_unit = {unit: [f"u{unit}-{i}" for i in range(5)] for unit in (1, 2)}
+    monkeypatch.setattr(alarms, "alarm_sources", index)
+    return index
+
+
+def test_long_source_list_stays_out_of_sql(many_sources):
+    where, params, keep = alarms.recent_filter(1)
+    assert where == ["source IS NOT NULL"] and params == []
+    assert keep("u1-4") and not keep("u2-0")
+
+
+def test_short_source_list_is_in_sql(many_sources, monkeypatch):
+    monkeypatch.setattr(alarms, "RECENT_IN_MAX", 10)
+    where, params, keep = alarms.recent_filter(1)
+    assert params == [f"u1-{i}" for i in range(5)] and keep is None
+
+
+def test_filtered_scan_fills_page_across_batches(many_sources):
+    # Unit 1 owns every third row, newest first
+    table = [{"id": 100 - i, "eventtime": T0 - timedelta(minutes=i), "source": f"u{1 if i % 3 == 0 else 2}-{i % 5}"}
+             for i in range(20)]
+    selected = alarms.recent_filter(1)
+    rows, queries = run_scan(alarms.page_scan(*selected, None, 5), table)
+    assert [row["id"] for row in rows] == [100, 97, 94, 91, 88]
+    assert queries == 4
+
+    before = (rows[-1]["eventtime"], rows[-1]["id"])
+    rows, _ = run_scan(alarms.page_scan(*selected, before, 5), table)
+    assert [row["id"] for row in rows] == [85, 82]
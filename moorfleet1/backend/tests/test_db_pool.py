@@ -0,0 +1,134 @@
+# tests/test_db_pool.py
+import threading
+import time
+
+import mysql.connector
+import pytest
+
+from db import ConnectionPool, PoolTimeout
+
+
+class FakeRaw:
+    """Stands in for a mysql.connector connection."""
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.alive = True
+        self.in_transaction = False
+        self.unread_result = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise mysql.connector.errors.InterfaceError("gone away")
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def consume_results(self):
+        self.unread_result = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__({}, **kwargs)
+        self.connected = []
+        self.fail_connect = False
+
+    def _connect(self):
+        if self.fail_connect:
+            raise mysql.connector.errors.InterfaceError("refused")
+        raw = FakeRaw(len(self.connected))
+        self.connected.append(raw)
+        return raw
+
+
+def test_release_reuses_connection():
+    pool = FakePool(size=2)
+    with pool.acquire() as conn:
+        first = conn._raw
+    with pool.acquire() as conn:
+        assert conn._raw is first
+    assert pool.stats() == {"size": 2, "open": 1, "idle": 1}
+
+
+def test_exhausted_pool_times_out():
+    pool = FakePool(size=2, timeout=0.05)
+    held = [pool.acquire(), pool.acquire()]
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.05
+    assert len(pool.connected) == 2
+    for conn in held:
+        conn.close()
+
+
+def test_waiter_gets_released_connection():
+    pool = FakePool(size=1, timeout=5)
+    conn = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    assert not got
+    raw = conn._raw
+    conn.close()
+    waiter.join(1)
+    assert got and got[0]._raw is raw
+    got[0].close()
+
+
+def test_old_connection_is_recycled():
+    pool = FakePool(size=1, recycle=0)
+    with pool.acquire() as conn:
+        first = conn._raw
+    with pool.acquire() as conn:
+        assert conn._raw is not first
+    assert first.closed
+    assert pool.stats()["open"] == 1
+
+
+def test_dead_idle_connection_is_replaced():
+    pool = FakePool(size=1, ping_idle=0)
+    with pool.acquire() as conn:
+        first = conn._raw
+    first.alive = False
+    with pool.acquire() as conn:
+        assert conn._raw is not first
+    assert first.closed
+
+
+def test_release_rolls_back_open_transaction():
+    pool = FakePool(size=1)
+    with pool.acquire() as conn:
+        conn._raw.in_transaction = True
+        conn._raw.unread_result = True
+        raw = conn._raw
+    assert raw.rollbacks == 1 and not raw.unread_result
+    assert pool.stats()["idle"] == 1
+
+
+def test_failed_connect_frees_its_slot():
+    pool = FakePool(size=1, timeout=0.05)
+    pool.fail_connect = True
+    with pytest.raises(mysql.connector.errors.InterfaceError):
+        pool.acquire()
+    pool.fail_connect = False
+    with pool.acquire():
+        assert pool.stats()["open"] == 1
+
+
+def test_closed_connection_is_returned_once():
+    pool = FakePool(size=1)
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    assert pool.stats()["idle"] == 1
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        conn.cursor()
@@ -0,0 +1,159 @@
+# tests/test_kpi_cache.py
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from kpi_calculations import kpi_cache as kpi_cache_module
+from kpi_calculations.kpi_cache import KPICache
+
+END = datetime(2025, 8, 20, 12, 0, 30, tzinfo=timezone.utc)
+END_TS = int(END.timestamp()) // 60 * 60  # 1D bucket
+
+
+class Watermark:
+    def __init__(self, value=(END_TS + 100, END_TS + 100)):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(kpi_cache_module.time, "monotonic", lambda: clock["now"])
+    return clock
+
+
+def make_cache(watermark=None, **kwargs):
+    return KPICache(watermark_fn=watermark or Watermark(), watermark_interval=0, **kwargs)
+
+
+def test_key_aligns_end_to_bucket():
+    assert KPICache.key("mtbf", "U1", "1d", END) == ("mtbf", "U1", "1D", END_TS)
+
+
+def test_hit_after_put():
+    cache = make_cache()
+    key = cache.key("mtbf", "U1", "1D", END)
+    assert cache.get(key) == (False, None)
+    cache.put(key, 42)
+    assert cache.get(key) == (True, 42)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_entry_is_dropped(clock):
+    cache = make_cache()
+    key = cache.key("mtbf", "U1", "1D", END)
+    cache.put(key, 42)
+    clock["now"] += cache.ttl["1D"] + 1
+    assert cache.get(key) == (False, None)
+    assert cache.invalidations == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_watermark_past_window_end_keeps_entry():
+    watermark = Watermark()
+    cache = make_cache(watermark)
+    key = cache.key("mtbf", "U1", "1D", END)
+    cache.put(key, 42)
+    # New rows after a window that had already closed cannot change it
+    watermark.value = (END_TS + 500, END_TS + 500)
+    assert cache.get(key) == (True, 42)
+
+
+def test_new_rows_inside_window_invalidate():
+    watermark = Watermark((END_TS - 100, END_TS - 100))
+    cache = make_cache(watermark)
+    key = cache.key("mtbf", "U1", "1D", END)
+    cache.put(key, 42)
+    watermark.value = (END_TS - 50, END_TS - 100)
+    assert cache.get(key) == (False, None)
+    assert cache.invalidations == 1
+
+
+def test_watermark_going_back_invalidates():
+    watermark = Watermark()
+    cache = make_cache(watermark)
+    key = cache.key("mtbf", "U1", "1D", END)
+    cache.put(key, 42)
+    watermark.value = (END_TS + 50, END_TS + 100)  # rows deleted
+    assert cache.get(key) == (False, None)
+
+
+def test_least_recently_used_is_evicted():
+    cache = make_cache(max_entries=2)
+    keys = [cache.key("mtbf", unit, "1D", END) for unit in ("U1", "U2", "U3")]
+    cache.put(keys[0], 1)
+    cache.put(keys[1], 2)
+    cache.get(keys[0])
+    cache.put(keys[2], 3)
+    assert cache.get(keys[1]) == (False, None)
+    assert cache.get(keys[0]) == (True, 1)
+    assert cache.evictions == 1
+
+
+def test_watermark_is_requeried_after_interval(clock):
+    watermark = Watermark()
+    cache = KPICache(watermark_fn=watermark, watermark_interval=5)
+    cache.watermark()
+    cache.watermark()
+    assert watermark.calls == 1
+    clock["now"] += 6
+    cache.watermark()
+    assert watermark.calls == 2
+
+
+def test_get_or_compute_caches_value():
+    cache = make_cache()
+    calls = []
+
+    def compute(duration, end):
+        calls.append((duration, end))
+        return len(calls)
+
+    assert cache.get_or_compute("mtbf", "U1", "1d", compute, END) == 1
+    assert cache.get_or_compute("mtbf", "U1", "1D", compute, END) == 1
+    assert calls == [("1D", datetime.fromtimestamp(END_TS, tz=timezone.utc))]
+
+
+def test_get_or_compute_does_not_cache_errors():
+    cache = make_cache()
+
+    def fail(duration, end):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("mtbf", "U1", "1D", fail, END)
+    assert cache.get_or_compute("mtbf", "U1", "1D", lambda duration, end: 7, END) == 7
+
+
+def test_concurrent_misses_compute_once():
+    cache = make_cache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute(duration, end):
+        calls.append(duration)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute("mtbf", "U1", "1D", compute, END)))
+    leader.start()
+    started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(cache.get_or_compute("mtbf", "U1", "1D", compute, END)))
+               for _ in range(4)]
+    for waiter in waiters:
+        waiter.start()
+    while cache.flights.coalesced < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader, *waiters]:
+        thread.join(5)
+    assert calls == ["1D"]
+    assert results == ["value"] * 5
@@ -0,0 +1,77 @@
+# tests/test_kpi_precompute.py
+from datetime import datetime, timezone
+
+import pytest
+
+from kpi_calculations import kpi_precompute
+from kpi_calculations.kpi_precompute import KPIPrecompute
+
+NOW = datetime(2025, 8, 20, 12, 0, 30, tzinfo=timezone.utc)
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, sql, args=()):
+        self.db.statements.append((" ".join(sql.split()), args))
+        if "GET_LOCK" in sql:
+            self.result = (int(args[0] not in self.db.held_elsewhere),)
+        else:
+            self.result = (1,)
+
+    def executemany(self, sql, rows):
+        self.db.written.extend(rows)
+
+    def fetchone(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self):
+        self.statements = []
+        self.written = []
+        self.held_elsewhere = set()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(kpi_precompute, "get_connection", lambda: db)
+    monkeypatch.setattr(kpi_precompute, "compute_window",
+                        lambda dur, units, window_end: [(unit, dur, window_end) for unit in units])
+    return db
+
+
+def test_each_duration_has_its_own_lock(db):
+    db.held_elsewhere = {"moorfleet_kpi_precompute_1Y"}
+    scheduler = KPIPrecompute(["U1", "U2"])
+    scheduler.run_once(now=NOW)
+    assert set(scheduler.done) == {"1D", "7D", "30D"}
+    assert sorted({row[1] for row in db.written}) == ["1D", "30D", "7D"]
+
+
+def test_only_moved_windows_are_recomputed(db):
+    scheduler = KPIPrecompute(["U1"])
+    scheduler.run_once(["1D"], now=NOW)
+    scheduler.run_once(["1D"], now=NOW)
+    assert len(db.written) == 1
+    scheduler.run_once(["1D"], now=NOW.replace(minute=1))
+    assert len(db.written) == 2
+
+
+def test_old_rows_are_pruned(db):
+    scheduler = KPIPrecompute(["U1", "U2"])
+    scheduler.run_once(["7D"], now=NOW)
+    deletes = [args for sql, args in db.statements if sql.startswith("DELETE")]
+    window_end = kpi_precompute.bucket_end("7D", NOW)
+    assert deletes == [("U1", "U2", "7D", kpi_precompute._naive_utc(window_end - kpi_precompute.HISTORY_RETENTION))]
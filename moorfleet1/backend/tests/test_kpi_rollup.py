@@ -0,0 +1,197 @@
+# tests/test_kpi_rollup.py
+import numpy as np
+import pytest
+
+from kpi_calculations import kpi_rollup
+from kpi_calculations.kpi_intervals import covered_between
+from kpi_calculations.kpi_rollup import DAY, HOUR, KPIRollup, bucket_edges, rolled_ranges, window_metrics
+
+UNIT = "U1"
+T0 = 1_700_006_400  # a midnight, UTC
+
+
+class FakeSource:
+    """Synthetic landing data: one state held over fixed intervals, plus failure events."""
+
+    def __init__(self):
+        self.held = (np.array([T0 + 1800, T0 + 30 * HOUR, T0 + 50 * HOUR]),
+                     np.array([T0 + 5 * HOUR, T0 + 31 * HOUR + 7, T0 + 70 * HOUR]))
+        self.failures = [T0 + 100, T0 + 2 * HOUR, T0 + 2 * HOUR + 5, T0 + 26 * HOUR, T0 + 60 * HOUR]
+
+    def raw_metrics(self, unit, edges):
+        edges = np.asarray(edges, dtype=np.int64)
+        a, b = edges[:-1], edges[1:]
+        failures = np.array(sorted(self.failures), dtype=np.int64)
+        first = np.searchsorted(failures, a, side="left")
+        last = np.searchsorted(failures, b, side="left")
+        has = last > first
+        return {
+            "observed": b - a,
+            "state_1": covered_between(*self.held, a, b),
+            "failures": last - first,
+            "failure_first": np.where(has, failures[np.minimum(first, len(failures) - 1)], np.nan),
+            "failure_last": np.where(has, failures[np.maximum(last - 1, 0)], np.nan),
+        }
+
+
+class FakeRollupCursor:
+    def __init__(self, table):
+        self.table = table  # (unit, resolution, bucket_start, metric) -> value
+        self.result = []
+
+    def execute(self, sql, args=()):
+        if "GET_LOCK" in sql or "RELEASE_LOCK" in sql:
+            self.result = [(1,)]
+        elif "GROUP BY resolution" in sql:
+            ranges = {}
+            for unit, resolution, bucket_start, _ in self.table:
+                if unit == args[0]:
+                    lo, hi = ranges.get(resolution, (bucket_start, bucket_start))
+                    ranges[resolution] = (min(lo, bucket_start), max(hi, bucket_start))
+            self.result = [(resolution, lo, hi) for resolution, (lo, hi) in ranges.items()]
+        elif "SELECT bucket_start, metric, value" in sql:
+            unit, pieces = args[0], [args[i:i + 3] for i in range(1, len(args), 3)]
+            self.result = [(bucket_start, metric, value)
+                           for (row_unit, resolution, bucket_start, metric), value in self.table.items()
+                           if row_unit == unit and any(resolution == res and lo <= bucket_start < hi
+                                                       for res, lo, hi in pieces)]
+        elif "REPLACE INTO" in sql:
+            self._sum_days(args)
+        else:
+            self.result = []
+
+    def _sum_days(self, args):
+        n_first, n_last = len(kpi_rollup.FIRST_METRICS), len(kpi_rollup.LAST_METRICS)
+        unit, _, day_from, day_to = args[2 + n_first + n_last:6 + n_first + n_last]
+        days = {}
+        for (row_unit, resolution, bucket_start, metric), value in list(self.table.items()):
+            if row_unit == unit and resolution == HOUR and day_from <= bucket_start < day_to:
+                days.setdefault((bucket_start - bucket_start % DAY, metric), []).append(value)
+        for (day, metric), values in days.items():
+            combine = min if metric in kpi_rollup.FIRST_METRICS else max if metric in kpi_rollup.LAST_METRICS else sum
+            self.table[(unit, DAY, day, metric)] = combine(values)
+
+    def executemany(self, sql, rows):
+        for unit, resolution, bucket_start, metric, value in rows:
+            self.table[(unit, resolution, bucket_start, metric)] = value
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return list(self.result)
+
+    def close(self):
+        pass
+
+
+class FakeRollupConnection:
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self):
+        return FakeRollupCursor(self.table)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def source(monkeypatch):
+    source = FakeSource()
+    monkeypatch.setattr(kpi_rollup, "raw_metrics", source.raw_metrics)
+    monkeypatch.setattr(kpi_rollup, "ROLLUP_BACKFILL", kpi_rollup.timedelta(days=3))
+    return source
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = {}
+    monkeypatch.setattr(kpi_rollup, "get_connection", lambda: FakeRollupConnection(table))
+    return table
+
+
+def assert_same_metrics(got, expected):
+    assert set(got) == set(expected)
+    for metric in expected:
+        np.testing.assert_allclose(got[metric], expected[metric], equal_nan=True, err_msg=metric)
+
+
+def test_bucket_edges_whole_window():
+    assert bucket_edges(T0 + 10, T0 + 500).tolist() == [T0 + 10, T0 + 500]
+
+
+def test_bucket_edges_align_to_epoch_multiples():
+    assert bucket_edges(T0 + 600, T0 + 3 * HOUR + 60, HOUR).tolist() == [
+        T0 + 600, T0 + HOUR, T0 + 2 * HOUR, T0 + 3 * HOUR, T0 + 3 * HOUR + 60]
+    assert bucket_edges(T0, T0 + 2 * DAY, DAY).tolist() == [T0, T0 + DAY, T0 + 2 * DAY]
+
+
+def test_rolled_ranges_end_after_last_bucket(table):
+    for hour in range(3):
+        table[(UNIT, HOUR, T0 + hour * HOUR, "observed")] = HOUR
+    table[(UNIT, DAY, T0, "observed")] = DAY
+    table[("U2", HOUR, T0 + 10 * HOUR, "observed")] = HOUR
+    assert rolled_ranges(UNIT) == {HOUR: (T0, T0 + 3 * HOUR), DAY: (T0, T0 + DAY)}
+
+
+def test_rolled_ranges_empty(table):
+    assert rolled_ranges(UNIT) == {}
+
+
+@pytest.mark.parametrize("start, end, bucket", [
+    (T0 + 1234, T0 + 3 * DAY - 77, None),
+    (T0 + 1234, T0 + 3 * DAY - 77, HOUR),
+    (T0 + 1234, T0 + 3 * DAY - 77, 6 * HOUR),
+    (T0, T0 + 3 * DAY, DAY),
+    (T0 - DAY, T0 + 4 * DAY, DAY),    # reaches past both ends of the rolled range
+    (T0 + 100, T0 + 200, None),       # inside one hour: raw only
+])
+def test_rolled_window_matches_raw(source, table, start, end, bucket):
+    KPIRollup([UNIT]).roll_unit(FakeRollupConnection(table), FakeRollupCursor(table), UNIT, T0 + 3 * DAY + HOUR)
+    assert (UNIT, DAY, T0 + DAY, "observed") in table
+    edges, rolled = window_metrics(UNIT, start, end, bucket)
+
+    table.clear()
+    raw_edges, raw = window_metrics(UNIT, start, end, bucket)
+    assert edges.tolist() == raw_edges.tolist()
+    assert_same_metrics(rolled, raw)
+    assert_same_metrics(raw, source.raw_metrics(UNIT, edges))
+
+
+def test_combine_folds_first_last_and_sums():
+    out = {}
+    kpi_rollup._combine(out, 2, "failures", [0, 0, 1], [1, 2, 3])
+    kpi_rollup._combine(out, 2, "failure_first", [0, 0, 1], [50, 40, np.nan])
+    kpi_rollup._combine(out, 2, "failure_last", [0, 0, 1], [50, 40, np.nan])
+    assert out["failures"].tolist() == [3, 3]
+    np.testing.assert_array_equal(out["failure_first"], [40, np.nan])
+    np.testing.assert_array_equal(out["failure_last"], [50, np.nan])
+
+
+def test_roll_unit_rerolls_trailing_hours(source, table):
+    rollup = KPIRollup([UNIT])
+    now = T0 + 3 * DAY + HOUR
+    rollup.roll_unit(FakeRollupConnection(table), FakeRollupCursor(table), UNIT, now)
+
+    # A failure that lands late, inside the trailing window, is rolled up on the next run
+    source.failures.append(T0 + 3 * DAY - 2 * HOUR)
+    rollup.roll_unit(FakeRollupConnection(table), FakeRollupCursor(table), UNIT, now)
+    assert table[(UNIT, HOUR, T0 + 3 * DAY - 2 * HOUR, "failures")] == 1
+    assert table[(UNIT, DAY, T0 + 2 * DAY, "failures")] == 2
+
+
+def test_roll_unit_bounds_backfill_per_run(source, table, monkeypatch):
+    monkeypatch.setattr(kpi_rollup, "ROLLUP_DAYS_PER_RUN", 2)
+    monkeypatch.setattr(kpi_rollup, "ROLLUP_BACKFILL", kpi_rollup.timedelta(days=5))
+    rollup = KPIRollup([UNIT])
+    now = T0 + 5 * DAY + HOUR
+    rollup.roll_unit(FakeRollupConnection(table), FakeRollupCursor(table), UNIT, now)
+    assert rolled_ranges(UNIT)[HOUR] == (T0, T0 + 2 * DAY)
+    for _ in range(3):
+        rollup.roll_unit(FakeRollupConnection(table), FakeRollupCursor(table), UNIT, now)
+    assert rolled_ranges(UNIT)[HOUR] == (T0, T0 + 5 * DAY)
+    assert rolled_ranges(UNIT)[DAY] == (T0, T0 + 5 * DAY)
@@ -0,0 +1,111 @@
+# tests/test_single_flight.py
+import threading
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Start one leader inside ``fn``, then ``callers`` - 1 more; returns (threads, results, errors)."""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    threads[0].start()
+    return threads, results, errors
+
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    entered, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        entered.set()
+        release.wait(5)
+        return "result"
+
+    threads, results, errors = run_concurrently(flight, "k", fn, 5)
+    entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: flight.coalesced == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [1]
+    assert results == ["result"] * 5 and not errors
+    assert flight.in_flight() == 0
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+    entered, release = threading.Event(), threading.Event()
+
+    def fn():
+        entered.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    threads, results, errors = run_concurrently(flight, "k", fn, 3)
+    entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: flight.coalesced == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert not results
+    assert [str(e) for e in errors] == ["boom"] * 3
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.coalesced == 0
+
+
+def test_finished_call_is_not_remembered():
+    flight = SingleFlight()
+    calls = []
+    flight.do("k", lambda: calls.append(1))
+    flight.do("k", lambda: calls.append(1))
+    assert calls == [1, 1]
+
+
+def test_waiter_timeout_leaves_call_running():
+    flight = SingleFlight()
+    entered, release = threading.Event(), threading.Event()
+    results = []
+
+    def fn():
+        entered.set()
+        release.wait(5)
+        return "late"
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", fn)))
+    leader.start()
+    entered.wait(5)
+    with pytest.raises(TimeoutError):
+        flight.do("k", fn, timeout=0.01)
+    release.set()
+    leader.join(5)
+    assert results == ["late"]
+    assert flight.in_flight() == 0
@@ -0,0 +1,122 @@
+# tests/test_state_store.py
+import numpy as np
+import pytest
+
+from utils import state_store
+from utils.state_store import StateStore, TransitionLog
+
+TAG = 7
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(state_store, "SEGMENT_RECORDS", 3)
+
+
+class FakeHistorian:
+    """In-memory historian rows; ``now`` is epoch ms."""
+
+    def __init__(self, now):
+        self.now = now
+        self.rows = []
+
+    def add(self, t, value):
+        self.rows.append({"tagid": TAG, "t_stamp": t, "intvalue": value})
+        self.rows.sort(key=lambda row: row["t_stamp"])
+
+    def now_ms(self):
+        return self.now
+
+    def read_range(self, tagids, start, end=None, descending=False, limit=None):
+        return [row for row in self.rows if row["tagid"] in tagids and start <= row["t_stamp"] <= end]
+
+
+@pytest.fixture
+def fake_historian(monkeypatch):
+    fake = FakeHistorian(now=1_000_000)
+    monkeypatch.setattr(state_store.historian, "now_ms", fake.now_ms)
+    monkeypatch.setattr(state_store.historian, "read_range", fake.read_range)
+    return fake
+
+
+def test_append_keeps_only_changes(tmp_path):
+    log = TransitionLog(str(tmp_path))
+    log.append([10, 20, 30, 40], [1, 1, 2, 2], 40)
+    log.append([40, 50, 60], [2, 2, 1], 60)
+    ts, states = log.read()
+    assert ts.tolist() == [10, 30, 60]
+    assert states.tolist() == [1, 2, 1]
+    assert log.watermark == 60
+
+
+def test_recover_resumes_from_stored_watermark(tmp_path):
+    log = TransitionLog(str(tmp_path))
+    log.append([10, 20], [1, 2], 25)
+    reopened = TransitionLog(str(tmp_path))
+    assert reopened.watermark == 25
+    assert reopened.last == (20, 2)
+
+
+def test_recover_drops_torn_record(tmp_path):
+    log = TransitionLog(str(tmp_path))
+    log.append([10, 20], [1, 2], 20)
+    with open(log._segments()[-1], "ab") as f:
+        f.write(b"\x01\x02\x03")
+    reopened = TransitionLog(str(tmp_path))
+    assert reopened.read()[0].tolist() == [10, 20]
+
+
+def test_read_spans_segments(tmp_path, small_segments):
+    log = TransitionLog(str(tmp_path))
+    log.append([10, 20, 30, 40, 50, 60, 70], [1, 2, 1, 2, 1, 2, 1], 70)
+    assert len(log._segments()) == 3
+    ts, states = log.read()
+    assert ts.tolist() == [10, 20, 30, 40, 50, 60, 70]
+    assert states.tolist() == [1, 2, 1, 2, 1, 2, 1]
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (45, None, [40, 50, 60, 70]),  # start inside the second segment
+    (40, 55, [40, 50]),            # start on a segment's first record
+    (35, 45, [30, 40]),            # state in force at start is the previous segment's last
+    (65, 70, [60, 70]),            # start inside the last segment
+    (5, 15, [10]),                 # start before the first record
+    (80, None, [70]),              # start after the newest record
+])
+def test_read_at_segment_boundaries(tmp_path, small_segments, start, end, expected):
+    log = TransitionLog(str(tmp_path))
+    log.append([10, 20, 30, 40, 50, 60, 70], [1, 2, 1, 2, 1, 2, 1], 70)
+    assert log.read(start, end)[0].tolist() == expected
+
+
+def test_update_appends_only_settled_rows(tmp_path, fake_historian):
+    settled = fake_historian.now - int(state_store.SAFETY_LAG * 1000)
+    fake_historian.add(settled - 100, 1)
+    fake_historian.add(settled + 100, 2)
+    store = StateStore([TAG], root=str(tmp_path))
+    store.update_once()
+    assert store.transitions(TAG)[0].tolist() == [settled - 100]
+    assert store.watermark(TAG) == settled
+
+    # A row landing late inside the unsettled span is still logged in order
+    fake_historian.add(settled + 50, 3)
+    fake_historian.now += 60_000
+    store.update_once()
+    ts, states = store.transitions(TAG)
+    assert ts.tolist() == [settled - 100, settled + 50, settled + 100]
+    assert states.tolist() == [1, 3, 2]
+
+
+def test_runs_extend_with_new_transitions(tmp_path, fake_historian):
+    settled = fake_historian.now - int(state_store.SAFETY_LAG * 1000)
+    fake_historian.add(settled - 3000, 1)
+    fake_historian.add(settled - 2000, 2)
+    store = StateStore([TAG], root=str(tmp_path))
+    store.update_once()
+    assert store.runs(TAG).dwell(settled - 3000, settled) == {1: 1000, 2: 2000}
+
+    fake_historian.add(settled + 1000, 1)
+    fake_historian.now += 60_000
+    store.update_once()
+    assert store.runs(TAG).dwell(settled - 3000, settled + 2000) == {1: 2000, 2: 3000}
+    assert np.array_equal(store.runs(TAG).ts, [settled - 3000, settled - 2000, settled + 1000])
@@ -0,0 +1,90 @@
+# utils/alarm_sources.py
+import os
+import threading
+import time
+
+from db import get_connection
+
+SOURCE_REFRESH = float(os.environ.get("MOORFLEET_ALARM_SOURCE_REFRESH", "1"))  # seconds
+SOURCE_WARM_WAIT = float(os.environ.get("MOORFLEET_ALARM_SOURCE_WARM_WAIT", "2"))  # seconds a request waits for warm-up
+
+
+class AlarmSourceIndex:
+    """Distinct ``alarm_events.source`` values, each resolved once to a unit.
+
+    ``attribute(source)`` returns the display unit id (or None) and
+    ``exclude(source)`` whether the source is hidden from alarm lists.
+    Refreshes read only events past the highest id seen so far; the first,
+    full one runs in a background thread started by ``warm()``.
+    """
+
+    def __init__(self, attribute, exclude):
+        self.attribute = attribute
+        self.exclude = exclude
+        self.max_id = 0
+        self.units = {}       # source -> display unit id
+        self.by_unit = {}     # display unit id -> [source]
+        self.excluded = []    # sources hidden from alarm lists
+        self._lock = threading.Lock()
+        self._refreshed_at = None
+        self._warmed = threading.Event()
+        self._warm_lock = threading.Lock()
+        self._warm_thread = None
+
+    def refresh(self, max_age=SOURCE_REFRESH):
+        with self._lock:
+            if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < max_age:
+                return
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT source, MAX(id)
+                    FROM ignitiondb.alarm_events
+                    WHERE id > %s AND source IS NOT NULL
+                    GROUP BY source
+                """, (self.max_id,))
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                conn.close()
+            for source, last_id in rows:
+                if source not in self.units:
+                    unit_id = self.attribute(source)
+                    self.units[source] = unit_id
+                    if self.exclude(source):
+                        self.excluded.append(source)
+                    elif unit_id is not None:
+                        self.by_unit.setdefault(unit_id, []).append(source)
+                self.max_id = max(self.max_id, last_id)
+            self._refreshed_at = time.monotonic()
+            self._warmed.set()
+
+    def _warm(self):
+        while not self._warmed.is_set():
+            try:
+                self.refresh(0)
+            except Exception as e:
+                print(f"Alarm source warm-up failed: {e}")
+                time.sleep(SOURCE_REFRESH)
+
+    def warm(self):
+        """Start the first full refresh in the background, once."""
+        with self._warm_lock:
+            if self._warm_thread is None and not self._warmed.is_set():
+                self._warm_thread = threading.Thread(target=self._warm, name="alarm-sources", daemon=True)
+                self._warm_thread.start()
+
+    def ready(self, timeout=SOURCE_WARM_WAIT):
+        """Start warming if needed; True once the first refresh has finished (waiting up to timeout)."""
+        self.warm()
+        return self._warmed.wait(timeout)
+
+    def unit_of(self, source):
+        return self.units.get(source)
+
+    def sources_for(self, unit_id):
+        return list(self.by_unit.get(unit_id, ()))
+
+    def excluded_sources(self):
+        return list(self.excluded)
@@ -0,0 +1,55 @@
+# utils/async_db.py
+"""aiomysql pool for the ASGI entry point (optional dependency: aiomysql)."""
+from db import DB_CONFIG, POOL_SIZE
+from utils import timing
+
+_pool = None
+
+
+async def open_pool(size=POOL_SIZE):
+    global _pool
+    import aiomysql
+
+    if _pool is None:
+        _pool = await aiomysql.create_pool(
+            host=DB_CONFIG["host"], port=DB_CONFIG["port"], user=DB_CONFIG["user"],
+            password=DB_CONFIG["password"], db=DB_CONFIG["database"],
+            connect_timeout=DB_CONFIG["connection_timeout"], autocommit=True,
+            minsize=1, maxsize=size, pool_recycle=1800)
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+
+def pool():
+    if _pool is None:
+        raise RuntimeError("Async database pool is not open")
+    return _pool
+
+
+async def fetch_all(query, params=(), dictionary=True):
+    import aiomysql
+
+    async with pool().acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor if dictionary else aiomysql.Cursor) as cursor:
+            with timing.phase("query"):
+                await cursor.execute(query, params)
+            with timing.phase("fetch"):
+                rows = await cursor.fetchall()
+            timing.count_rows(len(rows))
+            return rows
+
+
+async def execute(query, params=()):
+    """Run one statement; returns the affected row count."""
+    async with pool().acquire() as conn:
+        async with conn.cursor() as cursor:
+            with timing.phase("query"):
+                await cursor.execute(query, params)
+            return cursor.rowcount
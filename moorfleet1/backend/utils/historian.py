@@ -0,0 +1,190 @@
+# utils/historian.py
+import asyncio
+import heapq
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from db import get_connection
+from utils import timing
+
+# Ignition historian: one sqlt_data_<driver>_<yyyy>_<mm> table per partition,
+# registered in sqlth_partitions with [start_time, end_time) in epoch ms.
+HISTORIAN_DRIVER = int(os.environ.get("MOORFLEET_HISTORIAN_DRIVER", "1"))
+PARTITION_REFRESH = 300  # seconds between partition list reloads
+READ_WORKERS = 4
+
+_TABLE_RE = re.compile(r"^sqlt_data_(\d+)_(\d{4})_(\d{2})$")
+
+_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="historian")
+_lock = threading.Lock()
+_partitions = []  # [(start_ms, end_ms, table)] sorted by start
+_loaded_at = None
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def to_ms(value):
+    """datetime or epoch seconds/ms -> epoch ms."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+def _month_bounds(year, month):
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return to_ms(start), to_ms(end)
+
+
+def _load_partitions(cursor):
+    try:
+        cursor.execute("""
+            SELECT pname, start_time, end_time
+            FROM sqlth_partitions
+            WHERE pname LIKE %s
+        """, (f"sqlt\\_data\\_{HISTORIAN_DRIVER}\\_%",))
+        return [(int(start), int(end), pname) for pname, start, end in cursor.fetchall()]
+    except Exception:
+        # No partition registry: derive month bounds from the table names
+        cursor.execute("""
+            SELECT table_name
+            FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name LIKE %s
+        """, (f"sqlt\\_data\\_{HISTORIAN_DRIVER}\\_%",))
+        parts = []
+        for (name,) in cursor.fetchall():
+            m = _TABLE_RE.match(name)
+            if m:
+                parts.append((*_month_bounds(int(m.group(2)), int(m.group(3))), name))
+        return parts
+
+
+def list_partitions(force=False):
+    """All known partitions as (start_ms, end_ms, table), oldest first."""
+    global _partitions, _loaded_at
+    with _lock:
+        if not force and _loaded_at is not None and time.monotonic() - _loaded_at < PARTITION_REFRESH:
+            return _partitions
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        parts = sorted(_load_partitions(cursor))
+        cursor.close()
+    finally:
+        conn.close()
+    with _lock:
+        _partitions, _loaded_at = parts, time.monotonic()
+    return parts
+
+
+def partitions_for(start_ms, end_ms=None):
+    """Tables whose [start, end) range overlaps [start_ms, end_ms]; the rest are pruned."""
+    end_ms = now_ms() if end_ms is None else end_ms
+    parts = list_partitions()
+    # A time past the newest partition usually means a new month has begun
+    if parts and end_ms >= parts[-1][1]:
+        parts = list_partitions(force=True)
+    return [table for start, end, table in parts if start <= end_ms and end > start_ms]
+
+
+def _partition_query(table, tagids, start_ms, end_ms, descending, limit):
+    placeholders = ", ".join(["%s"] * len(tagids))
+    query = f"""
+        SELECT tagid, intvalue, t_stamp
+        FROM {table}
+        WHERE tagid IN ({placeholders}) AND t_stamp >= %s AND t_stamp <= %s
+        ORDER BY t_stamp {'DESC' if descending else 'ASC'}
+    """
+    params = [*tagids, start_ms, end_ms]
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+
+def _query_partition(table, tagids, start_ms, end_ms, descending, limit):
+    conn = get_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(*_partition_query(table, tagids, start_ms, end_ms, descending, limit))
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return rows
+
+
+def _merge(partition_rows, descending, limit):
+    merged = heapq.merge(*partition_rows, key=lambda row: row["t_stamp"], reverse=descending)
+    rows = list(merged)
+    return rows[:limit] if limit is not None else rows
+
+
+def read_range(tagids, start, end=None, descending=False, limit=None):
+    """Rows {tagid, intvalue, t_stamp} for tags in [start, end] across partitions.
+
+    Relevant partitions are queried in parallel and merged into one stream
+    ordered by t_stamp (newest first when ``descending``).
+    """
+    tagids = list(tagids)
+    start_ms = to_ms(start)
+    end_ms = now_ms() if end is None else to_ms(end)
+    tables = partitions_for(start_ms, end_ms)
+    if not tagids or not tables:
+        return []
+    futures = [_executor.submit(timing.bind(_query_partition), table, tagids, start_ms, end_ms, descending, limit)
+               for table in tables]
+    return _merge([f.result() for f in futures], descending, limit)
+
+
+async def read_range_async(tagids, start, end=None, descending=False, limit=None):
+    """read_range over the async pool; partitions are queried concurrently."""
+    from utils import async_db
+
+    tagids = list(tagids)
+    start_ms = to_ms(start)
+    end_ms = now_ms() if end is None else to_ms(end)
+    # The partition list is cached; a reload runs off the event loop
+    tables = await asyncio.get_running_loop().run_in_executor(None, partitions_for, start_ms, end_ms)
+    if not tagids or not tables:
+        return []
+    results = await asyncio.gather(*(
+        async_db.fetch_all(*_partition_query(table, tagids, start_ms, end_ms, descending, limit))
+        for table in tables))
+    return _merge(results, descending, limit)
+
+
+def latest_rows(tagids):
+    """Newest row per tag, searching from the newest partition backwards."""
+    missing = set(tagids)
+    latest = {}
+    for _, _, table in reversed(list_partitions()):
+        if not missing:
+            break
+        conn = get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            for tagid in list(missing):
+                cursor.execute(f"""
+                    SELECT tagid, intvalue, t_stamp
+                    FROM {table}
+                    WHERE tagid = %s
+                    ORDER BY t_stamp DESC
+                    LIMIT 1
+                """, (tagid,))
+                row = cursor.fetchone()
+                if row:
+                    latest[tagid] = row
+                    missing.discard(tagid)
+            cursor.close()
+        finally:
+            conn.close()
+    return latest
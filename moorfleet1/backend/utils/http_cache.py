@@ -0,0 +1,84 @@
+# utils/http_cache.py
+import gzip
+import hashlib
+import os
+
+from flask import current_app, request
+
+from utils import timing
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("MOORFLEET_COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_TYPES = ("application/json", "text/plain")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def make_etag(*parts):
+    """Opaque tag for a response derived from data watermarks, not from the body."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value names ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/").strip('"') == etag for tag in tags)
+
+
+def not_modified(etag):
+    """A 304 response if the client already holds ``etag``, else None."""
+    if etag is None or not etag_matches(request.headers.get("If-None-Match"), etag):
+        return None
+    return tag(current_app.response_class(status=304), etag)
+
+
+def etag_headers(etag):
+    """ETag and Cache-Control headers for responses built outside Flask (ASGI mode)."""
+    return {"ETag": f'W/"{etag}"', "Cache-Control": "no-cache"} if etag is not None else {}
+
+
+def tag(response, etag):
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        # Clients keep the body but revalidate on every poll
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response):
+    """gzip / brotli large JSON and text bodies the client accepts compressed."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESS_TYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _encoding()
+    if encoding is None:
+        return response
+    with timing.phase("serialize"):
+        body = (brotli.compress(data, quality=BROTLI_QUALITY) if encoding == "br"
+                else gzip.compress(data, compresslevel=GZIP_LEVEL))
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
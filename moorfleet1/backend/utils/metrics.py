@@ -0,0 +1,150 @@
+# utils/metrics.py
+import threading
+from bisect import bisect_left
+
+from flask import g, request
+from flask.json.provider import DefaultJSONProvider
+
+from utils import timing
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in Prometheus text format."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, counts in series:
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {counts[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+request_seconds = Histogram(
+    "moorfleet_http_request_duration_seconds", "Request latency.",
+    ("method", "endpoint", "status"), LATENCY_BUCKETS)
+phase_seconds = Histogram(
+    "moorfleet_http_request_phase_seconds", "Time per request spent in each phase.",
+    ("method", "endpoint", "phase"), LATENCY_BUCKETS)
+rows_fetched = Histogram(
+    "moorfleet_http_request_rows_fetched", "Database rows fetched per request.",
+    ("method", "endpoint"), ROW_BUCKETS)
+
+
+def render():
+    lines = []
+    for histogram in (request_seconds, phase_seconds, rows_fetched):
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Charges JSON encoding to the "serialize" phase."""
+
+    def dumps(self, obj, **kwargs):
+        with timing.phase("serialize"):
+            return super().dumps(obj, **kwargs)
+
+
+def server_timing(timings, total):
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.phases.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    entries.append(f'rows;desc="{timings.rows}"')
+    return ", ".join(entries)
+
+
+def record(method, endpoint, status, timings, total):
+    """Feed one finished request into the histograms."""
+    request_seconds.observe((method, endpoint, str(status)), total)
+    for name, seconds in timings.phases.items():
+        phase_seconds.observe((method, endpoint, name), seconds)
+    rows_fetched.observe((method, endpoint), timings.rows)
+
+
+def init_app(app):
+    """Time every request, add a Server-Timing header and feed the histograms."""
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def _start_timing():
+        g.timing_token = timing.begin()
+
+    @app.after_request
+    def _record_timing(response):
+        timings = timing.current()
+        if timings is None:
+            return response
+        total = timings.elapsed()
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        record(request.method, endpoint, response.status_code, timings, total)
+        response.headers["Server-Timing"] = server_timing(timings, total)
+        response.headers["Timing-Allow-Origin"] = "*"
+        return response
+
+    @app.teardown_request
+    def _end_timing(exc):
+        token = g.pop("timing_token", None)
+        if token is not None:
+            try:
+                timing.end(token)
+            except ValueError:
+                pass  # streamed response torn down outside the request's context
+
+
+class TimingMiddleware:
+    """ASGI counterpart of init_app for one route of the async handlers.
+
+    Times the request from arrival to the start of its response, adds the
+    Server-Timing header and feeds the same histograms under ``endpoint``.
+    """
+
+    def __init__(self, app, endpoint):
+        self.app = app
+        self.endpoint = endpoint
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = timing.begin()
+        timings = timing.current()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                total = timings.elapsed()
+                record(scope["method"], self.endpoint, message["status"], timings, total)
+                message = {**message, "headers": [
+                    *message.get("headers", []),
+                    (b"server-timing", server_timing(timings, total).encode("latin-1")),
+                    (b"timing-allow-origin", b"*")]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            timing.end(token)
@@ -0,0 +1,95 @@
+# utils/series.py
+import json
+from datetime import datetime
+
+import numpy as np
+from flask import Response, jsonify
+
+from utils import timing
+
+# Optional fast / binary serializers
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# ?format= values: verbose rows (default), parallel arrays, or a binary encoding of the arrays
+FORMATS = {
+    "rows": "application/json",
+    "columns": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+_REQUIRES = {"msgpack": "msgpack", "arrow": "pyarrow"}
+
+
+def parse_format(args):
+    """The requested series format; raises ValueError if unknown or not installed."""
+    fmt = args.get("format", "rows")
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {sorted(FORMATS)}")
+    if (fmt == "msgpack" and msgpack is None) or (fmt == "arrow" and pa is None):
+        raise ValueError(f"format={fmt} needs the {_REQUIRES[fmt]} package")
+    return fmt
+
+
+def _default(value):
+    """NumPy values and datetimes (incl. pandas Timestamps, as epoch ms) for any encoder."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _as_list(values):
+    return values.tolist() if isinstance(values, np.ndarray) else list(values)
+
+
+def _contiguous(values):
+    return np.ascontiguousarray(values) if isinstance(values, np.ndarray) else values
+
+
+def to_rows(columns):
+    """One dict per point, for format=rows."""
+    lists = [_as_list(values) for values in columns.values()]
+    return [dict(zip(columns, values)) for values in zip(*lists)]
+
+
+def encode(columns, fmt):
+    """Body bytes for a non-row format; columns are parallel arrays or lists."""
+    with timing.phase("serialize"):
+        if fmt == "columns":
+            if orjson is not None:
+                # Serializes NumPy arrays in C, without converting them to lists
+                return orjson.dumps({name: _contiguous(values) for name, values in columns.items()},
+                                    default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+            return json.dumps({name: _as_list(values) for name, values in columns.items()},
+                              default=_default, separators=(",", ":")).encode()
+        if fmt == "msgpack":
+            return msgpack.packb({name: _as_list(values) for name, values in columns.items()},
+                                 default=_default)
+        if fmt == "arrow":
+            table = pa.table({name: pa.array(_contiguous(values)) for name, values in columns.items()})
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def series_response(columns, fmt):
+    """Flask response for a series in the requested format."""
+    if fmt == "rows":
+        return jsonify(to_rows(columns))
+    return Response(encode(columns, fmt), mimetype=FORMATS[fmt])
@@ -0,0 +1,50 @@
+# utils/single_flight.py
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls: one caller per key computes, the others wait for it.
+
+    Waiters receive the leader's result or re-raise its exception. Nothing is
+    remembered once a call finishes; caching is left to the caller.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> Future of the call under way
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, fn, timeout=None):
+        """``fn()``, or the result of the identical call already running.
+
+        A waiter may give up after ``timeout`` seconds (TimeoutError) without
+        affecting the call. The leader always settles its waiters, even when
+        ``fn`` raises or the call is aborted.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                # A running future cannot be cancelled, so no waiter can cancel it for the others
+                call.set_running_or_notify_cancel()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result(timeout)
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
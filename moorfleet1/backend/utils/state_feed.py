@@ -0,0 +1,185 @@
+# utils/state_feed.py
+import os
+import queue
+import threading
+import time
+
+from utils import historian
+from utils.mooring_states import MOORING_STATES
+
+POLL_INTERVAL = float(os.environ.get("MOORFLEET_STATE_POLL_INTERVAL", "0.5"))  # seconds
+REFRESH_MAX_AGE = float(os.environ.get("MOORFLEET_STATE_MAX_AGE", "1.0"))      # seconds
+SUBSCRIBER_QUEUE_SIZE = 256
+# last_updated follows every row; subscribers and ETags see it move at most once per heartbeat
+HEARTBEAT_INTERVAL = float(os.environ.get("MOORFLEET_STATE_HEARTBEAT", "15"))  # seconds
+# Each poll re-reads this much before the watermark, for rows the historian writes late
+POLL_OVERLAP = float(os.environ.get("MOORFLEET_STATE_POLL_OVERLAP", "5"))  # seconds
+# After this long without a poll, reseed from the latest rows instead of replaying the backlog
+RESEED_AFTER = float(os.environ.get("MOORFLEET_STATE_RESEED_AFTER", "60"))  # seconds
+
+
+def heartbeat(t_stamp):
+    """Heartbeat period (epoch ms -> period number) a row time falls in."""
+    return int(t_stamp) // int(HEARTBEAT_INTERVAL * 1000)
+
+
+class StateFeed:
+    """In-memory latest-state index per unit, tailing the historian.
+
+    Each poll reads the rows since shortly before the last seen ``t_stamp``
+    (POLL_OVERLAP, so rows written late are not missed), updates the latest
+    state and ``last_updated`` per tag and publishes an event to subscribers
+    whenever a unit's ``intvalue`` changes, plus a heartbeat event when only
+    ``last_updated`` has entered a new heartbeat period. Requests call
+    ``refresh()`` (coalesced, at most one poll per ``max_age``); the tailer
+    thread polls continuously only while someone is subscribed. After an idle
+    spell the index is reseeded from the latest rows, so a new subscriber
+    gets the current state rather than every change it missed.
+    """
+
+    def __init__(self, tag_units, interval=POLL_INTERVAL):
+        self.tag_units = dict(tag_units)  # db tagid -> display id
+        self.interval = interval
+        self.watermark = None
+        self._last = {}  # tagid -> event
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._polled_at = None
+        self._thread = None
+        self._pinned = False  # keep tailing without subscribers
+        self._reseed = False  # set when the tailer stops
+
+    def _event(self, tagid, intvalue, t_stamp):
+        display_id = self.tag_units.get(tagid, tagid)
+        return {
+            "tagid": tagid,
+            "unit_id": display_id,
+            "unit": f"Unit {display_id}",
+            "state_code": intvalue,
+            "state": MOORING_STATES.get(intvalue, "Unknown"),
+            "last_updated": t_stamp
+        }
+
+    def _seed(self):
+        """Latest row per tag across partitions; returns events for the tags whose state it changes."""
+        rows = historian.latest_rows(self.tag_units).values()
+        changes = []
+        with self._lock:
+            for row in rows:
+                tagid, intvalue, t_stamp = row["tagid"], row["intvalue"], row["t_stamp"]
+                previous = self._last.get(tagid)
+                if previous is not None and t_stamp <= previous["last_updated"]:
+                    continue
+                event = self._event(tagid, intvalue, t_stamp)
+                if previous is None or previous["state_code"] != intvalue:
+                    changes.append(event)
+                elif heartbeat(t_stamp) != heartbeat(previous["last_updated"]):
+                    changes.append({**event, "heartbeat": True})
+                self._last[tagid] = event
+                if self.watermark is None or t_stamp > self.watermark:
+                    self.watermark = t_stamp
+        return changes
+
+    def poll(self):
+        """Read rows since the watermark; return the state-change and heartbeat events they produce."""
+        idle = self._polled_at is not None and time.monotonic() - self._polled_at > RESEED_AFTER
+        if self.watermark is None or idle or self._reseed:
+            # The latest rows are the current state; changes missed meanwhile are not replayed
+            self._reseed = False
+            return self._seed()
+        changes = []
+        # t_stamp is epoch ms; the reader spans a month rollover transparently
+        rows = historian.read_range(self.tag_units, self.watermark + 1 - int(POLL_OVERLAP * 1000))
+
+        with self._lock:
+            for row in rows:
+                tagid, intvalue, t_stamp = row["tagid"], row["intvalue"], row["t_stamp"]
+                previous = self._last.get(tagid)
+                if previous is not None and t_stamp <= previous["last_updated"]:
+                    continue  # already seen (overlap), or older than the unit's newest row
+                if previous is None or previous["state_code"] != intvalue:
+                    event = self._event(tagid, intvalue, t_stamp)
+                    changes.append(event)
+                    self._last[tagid] = event
+                else:
+                    # Same state: only the newest sample time moves
+                    self._last[tagid] = {**previous, "last_updated": t_stamp}
+                    if heartbeat(t_stamp) != heartbeat(previous["last_updated"]):
+                        changes.append({**self._last[tagid], "heartbeat": True})
+                self.watermark = max(self.watermark, t_stamp)
+        return changes
+
+    def refresh(self, max_age=REFRESH_MAX_AGE):
+        """Bring the index up to date unless it was refreshed within max_age seconds."""
+        with self._poll_lock:
+            if self._polled_at is not None and time.monotonic() - self._polled_at < max_age:
+                return []
+            changes = self.poll()
+            self._polled_at = time.monotonic()
+            # Published under the poll lock: one publisher at a time, in poll order
+            if changes:
+                self._publish(changes)
+        return changes
+
+    def current(self):
+        """Last known state event per unit."""
+        with self._lock:
+            return list(self._last.values())
+
+    def latest(self, tagid):
+        """Last known state event for one tag, or None if it is not indexed."""
+        with self._lock:
+            return self._last.get(tagid)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="state-feed", daemon=True)
+            self._thread.start()
+
+    def start(self):
+        """Tail continuously, so readers can use current() without refreshing."""
+        with self._lock:
+            self._pinned = True
+            self._ensure_thread()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(q)
+            self._ensure_thread()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def _publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            for event in events:
+                while True:
+                    try:
+                        q.put_nowait(event)
+                        break
+                    except queue.Full:
+                        # Slow consumer: drop its oldest event rather than block the tailer
+                        try:
+                            q.get_nowait()
+                        except queue.Empty:
+                            pass
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers and not self._pinned:
+                    self._thread = None
+                    self._reseed = True
+                    return
+            started = time.monotonic()
+            try:
+                self.refresh(max_age=0)
+            except Exception as e:
+                print(f"State feed poll failed: {e}")
+            time.sleep(max(self.interval - (time.monotonic() - started), 0.05))
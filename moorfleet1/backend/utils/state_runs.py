@@ -0,0 +1,80 @@
+# utils/state_runs.py
+import numpy as np
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class StateRuns:
+    """Run-length encoded state timeline with per-state prefix sums.
+
+    Each transition starts a run lasting until the next one; the newest run
+    is open. Per state, the closed runs' starts, ends and cumulative durations
+    are kept, so the time spent in a state over [start, end) is two binary
+    searches, whatever the length of the history. Times are in the unit the
+    transitions use (epoch ms in the state store).
+    """
+
+    def __init__(self):
+        self.ts = _EMPTY
+        self.states = np.zeros(0, dtype=np.int64)
+        self._index = ({}, None)  # (state -> (starts, ends, cumulative ms), (open state, open start))
+
+    @property
+    def last_start(self):
+        return int(self.ts[-1]) if len(self.ts) else None
+
+    def extend(self, ts, states):
+        """Add transitions (ascending times); ones not after the newest run are ignored."""
+        ts = np.asarray(ts, dtype=np.int64)
+        states = np.asarray(states, dtype=np.int64)
+        if len(self.ts):
+            newer = ts > self.ts[-1]
+            ts, states = ts[newer], states[newer]
+        if not len(ts):
+            return
+        ts, states = np.r_[self.ts, ts], np.r_[self.states, states]
+        change = np.r_[True, states[1:] != states[:-1]]
+        ts, states = ts[change], states[change]
+
+        # Transitions arrive only on state changes, so rebuilding is rare and linear
+        closed = {}
+        durations = np.diff(ts)
+        for state in np.unique(states[:-1]):
+            hit = states[:-1] == state
+            closed[int(state)] = (ts[:-1][hit], ts[1:][hit], np.r_[0, np.cumsum(durations[hit])])
+        self.ts, self.states = ts, states
+        self._index = (closed, (int(states[-1]), int(ts[-1])))
+
+    @staticmethod
+    def _before(runs, open_run, state, at):
+        """Time spent in ``state`` before each time in ``at``."""
+        spent = np.zeros(len(at), dtype=np.int64)
+        if state in runs:
+            starts, ends, cum = runs[state]
+            n = np.searchsorted(starts, at, side="right")  # runs started by then
+            last = np.maximum(n - 1, 0)
+            # Full durations of those runs, less the part of the last one after ``at``
+            spent += cum[n] - np.where(n > 0, np.maximum(ends[last] - at, 0), 0)
+        if open_run is not None and open_run[0] == state:
+            spent += np.maximum(at - open_run[1], 0)
+        return spent
+
+    def time_in_state(self, state, start, end):
+        """Time in ``state`` over [start, end); scalars or equal-length arrays."""
+        runs, open_run = self._index
+        lo = np.atleast_1d(np.asarray(start, dtype=np.int64))
+        hi = np.atleast_1d(np.asarray(end, dtype=np.int64))
+        spent = np.maximum(self._before(runs, open_run, state, hi) - self._before(runs, open_run, state, lo), 0)
+        return int(spent[0]) if np.ndim(start) == 0 and np.ndim(end) == 0 else spent
+
+    def dwell(self, start, end):
+        """{state: time} over [start, end) for every state seen, omitting zeros."""
+        runs, open_run = self._index
+        states = set(runs) | ({open_run[0]} if open_run else set())
+        at = np.array([start, end], dtype=np.int64)
+        spent = {}
+        for state in sorted(states):
+            before = self._before(runs, open_run, state, at)
+            if before[1] > before[0]:
+                spent[state] = int(before[1] - before[0])
+        return spent
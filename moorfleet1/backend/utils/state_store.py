@@ -0,0 +1,236 @@
+# utils/state_store.py
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from utils import historian
+from utils.state_runs import StateRuns
+
+# One record per state change: epoch ms + state code
+RECORD = np.dtype([("t", "<i8"), ("s", "i1")])
+
+STORE_DIR = os.environ.get(
+    "MOORFLEET_STATE_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "state_store"))
+SEGMENT_RECORDS = 1 << 20                                                    # records per segment file
+UPDATE_INTERVAL = float(os.environ.get("MOORFLEET_STATE_STORE_INTERVAL", "5"))  # seconds
+BACKFILL = timedelta(days=int(os.environ.get("MOORFLEET_STATE_STORE_BACKFILL_DAYS", "400")))
+READ_SPAN_MS = 24 * 3600 * 1000  # historian rows are read one day at a time
+STORE_ENABLED = os.environ.get("MOORFLEET_STATE_STORE", "1") == "1"  # background updater on / off
+READY_LAG = float(os.environ.get("MOORFLEET_STATE_STORE_READY_LAG", "60"))  # seconds behind now still served
+# The watermark stays this far behind now, so rows the historian writes late are still read
+SAFETY_LAG = float(os.environ.get("MOORFLEET_STATE_STORE_SAFETY_LAG", "30"))  # seconds
+
+
+class TransitionLog:
+    """Append-only transitions for one historian tag, stored in memory-mapped segments.
+
+    ``seg_<n>.bin`` files hold packed RECORDs; ``meta.json`` holds the
+    historian t_stamp read up to, so a restart resumes without re-scanning.
+    Rows past the watermark may be read again; ones not after the newest
+    record are skipped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._maps = {}  # segment path -> (size, memmap)
+        self.watermark = None
+        self.last = None  # (t, state) of the newest record
+        self._recover()
+
+    def _segments(self):
+        if not os.path.isdir(self.path):
+            return []
+        names = sorted(n for n in os.listdir(self.path) if n.startswith("seg_") and n.endswith(".bin"))
+        return [os.path.join(self.path, n) for n in names]
+
+    def stored_watermark(self):
+        """Watermark as last persisted (possibly by the writer in another process)."""
+        try:
+            with open(os.path.join(self.path, "meta.json")) as f:
+                return json.load(f).get("watermark")
+        except (OSError, ValueError):
+            return None
+
+    def _recover(self):
+        self.watermark = self.stored_watermark()
+        segments = self._segments()
+        if segments:
+            tail = segments[-1]
+            size = os.path.getsize(tail)
+            if size % RECORD.itemsize:
+                # Drop a torn record left by an interrupted append
+                with open(tail, "r+b") as f:
+                    f.truncate(size - size % RECORD.itemsize)
+            records = self._map(tail)
+            if len(records):
+                self.last = (int(records["t"][-1]), int(records["s"][-1]))
+                if self.watermark is None:
+                    # Re-reading from the newest record is safe: older rows are skipped on append
+                    self.watermark = self.last[0]
+
+    def _map(self, segment):
+        size = os.path.getsize(segment)
+        cached = self._maps.get(segment)
+        if cached and cached[0] == size:
+            return cached[1]
+        records = (np.memmap(segment, dtype=RECORD, mode="r") if size
+                   else np.zeros(0, dtype=RECORD))
+        self._maps[segment] = (size, records)
+        return records
+
+    def append(self, ts, states, watermark):
+        """Append the samples that change state; advance the watermark to ``watermark``."""
+        ts = np.asarray(ts, dtype=np.int64)
+        states = np.asarray(states, dtype=np.int8)
+        if self.last is not None:
+            # Re-read rows already covered by the log
+            newer = ts > self.last[0]
+            ts, states = ts[newer], states[newer]
+        if len(ts):
+            prev = np.r_[self.last[1] if self.last else -1, states[:-1]]
+            changed = states != prev
+            if self.last is None:
+                changed[0] = True
+            records = np.empty(int(changed.sum()), dtype=RECORD)
+            records["t"], records["s"] = ts[changed], states[changed]
+            self._write(records)
+        os.makedirs(self.path, exist_ok=True)
+        self.watermark = watermark
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"watermark": watermark}, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _write(self, records):
+        os.makedirs(self.path, exist_ok=True)
+        while len(records):
+            segments = self._segments()
+            tail = segments[-1] if segments else None
+            used = os.path.getsize(tail) // RECORD.itemsize if tail else SEGMENT_RECORDS
+            if used >= SEGMENT_RECORDS:
+                tail = os.path.join(self.path, f"seg_{len(segments):06d}.bin")
+                used = 0
+            room = SEGMENT_RECORDS - used
+            with open(tail, "ab") as f:
+                f.write(records[:room].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.last = (int(records["t"][min(room, len(records)) - 1]),
+                         int(records["s"][min(room, len(records)) - 1]))
+            records = records[room:]
+
+    def read(self, start=None, end=None):
+        """Transitions with start <= t <= end, plus the one in force at ``start``."""
+        parts = []
+        for segment in self._segments():
+            records = self._map(segment)
+            if not len(records):
+                continue
+            if end is not None and records["t"][0] > end:
+                break
+            lo = 0 if start is None else max(np.searchsorted(records["t"], start, side="right") - 1, 0)
+            hi = len(records) if end is None else np.searchsorted(records["t"], end, side="right")
+            if start is not None and records["t"][-1] < start:
+                parts = [records[-1:]]  # only the latest state before start matters
+                continue
+            if start is not None and records["t"][0] <= start:
+                parts = []  # the state in force at start is in this segment
+            parts.append(records[lo:hi])
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8)
+        records = np.concatenate(parts)
+        return records["t"].astype(np.int64), records["s"].astype(np.int8)
+
+
+class StateStore:
+    """Transition logs for a set of historian tags, kept current by a background updater.
+
+    Only one process writes the store (guarded by an exclusive lock file);
+    any process may read it.
+    """
+
+    def __init__(self, tagids, root=STORE_DIR, interval=UPDATE_INTERVAL):
+        self.tagids = list(tagids)
+        self.root = root
+        self.interval = interval
+        self.logs = {tagid: TransitionLog(os.path.join(root, f"tag_{tagid}")) for tagid in self.tagids}
+        self._runs = {}  # tagid -> StateRuns over the whole log
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._thread = None
+
+    def update_once(self):
+        """Append settled historian rows past each tag's watermark, one day of rows at a time.
+
+        Only rows up to now - SAFETY_LAG are read: the last SAFETY_LAG seconds
+        wait for the next update, so rows the historian writes late are logged
+        in order instead of being skipped behind a newer transition.
+        """
+        now = historian.now_ms()
+        settled = now - int(SAFETY_LAG * 1000)
+        for tagid, log in self.logs.items():
+            start = (log.watermark + 1 if log.watermark is not None
+                     else now - int(BACKFILL.total_seconds() * 1000))
+            while start <= settled:
+                end = min(start + READ_SPAN_MS - 1, settled)
+                rows = historian.read_range([tagid], start, end)
+                with self._lock:
+                    log.append([r["t_stamp"] for r in rows], [r["intvalue"] or 0 for r in rows], end)
+                start = end + 1
+
+    def watermark(self, tagid):
+        """Historian t_stamp (ms) the tag's log has been filled up to, or None."""
+        log = self.logs.get(tagid)
+        return log.stored_watermark() if log else None
+
+    def ready(self, tagid, max_lag=READY_LAG):
+        """True once the tag's log has been filled up to within max_lag seconds of now."""
+        watermark = self.watermark(tagid)
+        return watermark is not None and watermark >= historian.now_ms() - max_lag * 1000
+
+    def transitions(self, tagid, start=None, end=None):
+        """(t ms, state) arrays for one tag, read from the mapped segments."""
+        with self._lock:
+            return self.logs[tagid].read(start, end)
+
+    def runs(self, tagid):
+        """Run-length index of the tag's whole log, extended with transitions appended since last use."""
+        with self._lock:
+            runs = self._runs.get(tagid)
+            if runs is None:
+                runs = self._runs[tagid] = StateRuns()
+            runs.extend(*self.logs[tagid].read(runs.last_start))
+            return runs
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.update_once()
+            except Exception as e:
+                print(f"State store update failed: {e}")
+            time.sleep(max(self.interval - (time.monotonic() - started), 0.5))
+
+    def start(self):
+        """Start the updater unless it runs here already, another process owns the store or MOORFLEET_STATE_STORE=0."""
+        if not STORE_ENABLED:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.root, exist_ok=True)
+            lock_file = open(os.path.join(self.root, ".writer.lock"), "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return
+            self._lock_file = lock_file
+            self._thread = threading.Thread(target=self._run, name="state-store", daemon=True)
+            self._thread.start()
@@ -0,0 +1,95 @@
+# utils/timing.py
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+PHASES = ("connect", "query", "fetch", "compute", "serialize")
+
+_timings = contextvars.ContextVar("moorfleet_timings", default=None)
+_frame = contextvars.ContextVar("moorfleet_timing_frame", default=None)
+
+
+class RequestTimings:
+    """Seconds per phase and rows fetched for one request.
+
+    Phase times are exclusive: time spent in a nested phase (e.g. a query
+    inside a KPI computation) is charged to the inner phase only. Worker
+    threads started through ``bind`` add to the same object.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def _add(self, name, seconds, parent=None, elapsed=0.0):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            if parent is not None:
+                parent[0] += elapsed
+
+    def add_rows(self, n):
+        with self._lock:
+            self.rows += n
+
+    def merge(self, other):
+        with self._lock:
+            for name, seconds in other.phases.items():
+                self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.rows += other.rows
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def current():
+    """Timings of the request being handled, or None outside one."""
+    return _timings.get()
+
+
+def begin():
+    """Start collecting timings; pass the returned token to ``end``."""
+    return _timings.set(RequestTimings())
+
+
+def end(token):
+    """Stop collecting; an enclosing collector (if any) absorbs these timings."""
+    timings = _timings.get()
+    _timings.reset(token)
+    outer = _timings.get()
+    if outer is not None and timings is not None:
+        outer.merge(timings)
+    return timings
+
+
+@contextmanager
+def phase(name):
+    """Charge the enclosed block to ``name`` (a no-op outside a request)."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    parent = _frame.get()
+    frame = [0.0]  # seconds spent in nested phases
+    token = _frame.set(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _frame.reset(token)
+        timings._add(name, max(elapsed - frame[0], 0.0), parent, elapsed)
+
+
+def count_rows(n):
+    timings = _timings.get()
+    if timings is not None:
+        timings.add_rows(n)
+
+
+def bind(fn):
+    """Wrap fn to run in a copy of the caller's context (for executor submissions)."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)